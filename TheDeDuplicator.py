@@ -1,15 +1,16 @@
 import os
-import cv2
-import imagehash
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import subprocess
 import threading
-import queue
 import random
-from PIL import Image
-from moviepy import VideoFileClip
-from collections import defaultdict
+import time
+from collections import deque
+from itertools import islice
+from dedup_core import (find_duplicates, merge_shards, default_worker_count, default_cache_dir, ScanStats,
+                        DEFAULT_HAMMING_THRESHOLD, SHARD_SUFFIX, format_bytes, reclaimable_bytes)
+from dedup_delete import DeletionJournal, RecycleBin, default_recycle_bin_path, run_deletion, unfinished_journals
+from dedup_review import THUMB_WIDTH, THUMB_HEIGHT, PREFETCH_GROUPS, Prefetcher, describe_preview
 
 # --- About 50 Snapple-style Fun Facts ---
 snapple_facts = [
@@ -65,11 +66,12 @@ snapple_facts = [
 ]
 
 class ProgressPopup(tk.Toplevel):
-    def __init__(self, parent, max_value, get_theme_colors):
+    def __init__(self, parent, max_value, get_theme_colors, title="Scanning for duplicates...", verb="Scanning"):
         super().__init__(parent)
         self.parent = parent
         self.get_theme_colors = get_theme_colors  # function to get current colors
-        self.title("Scanning for duplicates...")
+        self.verb = verb
+        self.title(title)
         self.geometry("500x160")
         self.resizable(False, False)
         self.transient(parent)
@@ -83,7 +85,7 @@ class ProgressPopup(tk.Toplevel):
         self.progress.pack(pady=(10, 5))
 
         # Status label
-        self.status_label = tk.Label(self, text="Starting scan...", bg=self.colors["bg"], fg=self.colors["fg"])
+        self.status_label = tk.Label(self, text="Starting...", bg=self.colors["bg"], fg=self.colors["fg"])
         self.status_label.pack()
 
         # Fun fact label below progress bar
@@ -98,13 +100,21 @@ class ProgressPopup(tk.Toplevel):
         self.colors = self.get_theme_colors()
         self.configure(bg=self.colors["bg"])
 
-    def update_progress(self, current, total, filename=None):
+    def update_progress(self, current, total, filename=None, discovered=None):
+        if total is None:
+            # Discovery still running: show processed against discovered so far
+            self.progress['maximum'] = max(discovered or 0, current, 1)
+            self.progress['value'] = current
+            name = f": {os.path.basename(filename)}" if filename else ""
+            self.status_label.config(text=f"{self.verb} ({current} processed / {discovered} discovered){name}")
+            self.update_idletasks()
+            return
         self.progress['value'] = current
         percent = (current / total) * 100 if total else 0
         if filename:
-            self.status_label.config(text=f"Scanning ({current}/{total}): {os.path.basename(filename)}")
+            self.status_label.config(text=f"{self.verb} ({current}/{total}): {os.path.basename(filename)}")
         else:
-            self.status_label.config(text=f"Scanning... {int(percent)}%")
+            self.status_label.config(text=f"{self.verb}... {int(percent)}%")
         self.update_idletasks()
 
     def update_fun_fact(self):
@@ -119,47 +129,238 @@ class ProgressPopup(tk.Toplevel):
         super().destroy()
 
 
-def get_video_hash_duration_size(path):
-    try:
-        cap = cv2.VideoCapture(path)
-        success, frame = cap.read()
-        if not success:
-            return None, None, None
-        img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        img_hash = str(imagehash.phash(img))
-        duration = VideoFileClip(path).duration
-        size = os.path.getsize(path)
-        cap.release()
-        return img_hash, round(duration, 1), size
-    except Exception:
-        return None, None, None
-
-
-def scan_folder(folder, log, progress_queue=None, kill_flag=None):
-    log("🔍 Scanning for duplicates...")
-    seen = defaultdict(list)
-    files_to_scan = []
-    for root, _, files in os.walk(folder):
-        for file in files:
-            if file.lower().endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm')):
-                files_to_scan.append(os.path.join(root, file))
-
-    total_files = len(files_to_scan)
-    for idx, full_path in enumerate(files_to_scan, 1):
-        if kill_flag and kill_flag.is_set():
-            log("❌ Scan killed by user.")
-            return {}
-        hash_val, duration, size = get_video_hash_duration_size(full_path)
-        if None not in (hash_val, duration, size):
-            seen[(hash_val, duration, size)].append(full_path)
-        log(f"Indexed file {idx}/{total_files}: {os.path.basename(full_path)}")
-
-        if progress_queue:
-            progress_queue.put((idx, total_files, full_path))
-
-    dupes = {k: v for k, v in seen.items() if len(v) > 1}
-    log(f"📁 Found {len(dupes)} duplicate groups.")
-    return dupes
+# Tiles shown at once in the review window; larger groups are paged. The
+# window polls the prefetcher for previews still loading.
+REVIEW_TILES = 4
+REVIEW_REFRESH_MS = 100
+
+
+class ReviewWindow(tk.Toplevel):
+    # One window reused for every group in manual review. It owns a fixed set
+    # of tiles that are refilled for each group (and each page of a large
+    # group) instead of rebuilding widgets, and takes thumbnails and metadata
+    # from the prefetcher as they arrive.
+    def __init__(self, parent, get_theme_colors, prefetcher, on_keep, on_skip, on_stop, on_play):
+        super().__init__(parent)
+        self.get_theme_colors = get_theme_colors
+        self.prefetcher = prefetcher
+        self.on_keep = on_keep
+        self.on_skip = on_skip
+        self.on_stop = on_stop
+        self.on_play = on_play
+        self.title("Select File to Keep")
+        self.geometry(f"{REVIEW_TILES * (THUMB_WIDTH + 30)}x470")
+        self.protocol("WM_DELETE_WINDOW", self.on_stop)
+
+        self.files = []
+        self.upcoming = []
+        self.page = 0
+        self.pending = set()  # tile slots still waiting for a preview
+        self.images = [None] * REVIEW_TILES  # keeps the PhotoImages alive
+        self.after_id = None
+        self.blank = tk.PhotoImage(width=THUMB_WIDTH, height=THUMB_HEIGHT)
+
+        self.header = tk.Label(self, text="Choose which file to KEEP:", font=("Arial", 12, "bold"))
+        self.header.pack(pady=5)
+
+        tiles_frame = tk.Frame(self)
+        tiles_frame.pack(padx=5, pady=5)
+        self.tiles = []
+        for slot in range(REVIEW_TILES):
+            frame = tk.Frame(tiles_frame, bd=1, relief="groove")
+            frame.grid(row=0, column=slot, padx=4, sticky="n")
+            tile = {"frame": frame}
+            tile["image"] = tk.Label(frame, image=self.blank, compound="center")
+            tile["image"].pack(padx=4, pady=4)
+            tile["name"] = tk.Label(frame, font=("Arial", 10, "bold"), wraplength=THUMB_WIDTH)
+            tile["name"].pack()
+            tile["folder"] = tk.Label(frame, wraplength=THUMB_WIDTH, font=("Arial", 8))
+            tile["folder"].pack()
+            tile["meta"] = tk.Label(frame, justify="center")
+            tile["meta"].pack(pady=2)
+            buttons = tk.Frame(frame)
+            buttons.pack(pady=4)
+            tile["keep"] = tk.Button(buttons, width=10)
+            tile["keep"].pack(side="left")
+            tile["play"] = tk.Button(buttons, text="▶️", width=3)
+            tile["play"].pack(side="left", padx=4)
+            self.tiles.append(tile)
+
+        nav_frame = tk.Frame(self)
+        nav_frame.pack()
+        self.prev_button = tk.Button(nav_frame, text="◀", width=3, command=lambda: self.turn_page(-1))
+        self.prev_button.pack(side="left")
+        self.page_label = tk.Label(nav_frame, width=24)
+        self.page_label.pack(side="left")
+        self.next_button = tk.Button(nav_frame, text="▶", width=3, command=lambda: self.turn_page(1))
+        self.next_button.pack(side="left")
+
+        btn_frame = tk.Frame(self)
+        btn_frame.pack(pady=10)
+        tk.Button(btn_frame, text="Skip Group", command=self.on_skip, width=12).pack(side="left", padx=5)
+        tk.Button(btn_frame, text="Stop Scanning", command=self.on_stop, width=12).pack(side="left", padx=5)
+        tk.Label(self, text="Keys: 0-9 keep · S skip · ←/→ page · Esc stop", font=("Arial", 8)).pack()
+
+        self.bind("<Key>", self.on_key)
+        self.apply_theme()
+
+    def apply_theme(self):
+        colors = self.get_theme_colors()
+        pending = [self]
+        while pending:
+            widget = pending.pop()
+            if isinstance(widget, tk.Button):
+                widget.configure(bg=colors["button_bg"], fg=colors["button_fg"], activebackground=colors["highlight_bg"])
+            elif isinstance(widget, tk.Label):
+                widget.configure(bg=colors["bg"], fg=colors["fg"])
+            elif isinstance(widget, (tk.Frame, tk.Toplevel)):
+                widget.configure(bg=colors["bg"])
+            pending.extend(widget.winfo_children())
+
+    def show(self, title, files, upcoming=()):
+        # upcoming: files of the next groups, prefetched behind this one
+        self.files = files
+        self.upcoming = list(upcoming)
+        self.page = 0
+        self.header.config(text=title)
+        self.render()
+        self.deiconify()
+        self.lift()
+        self.focus_set()
+
+    def hide(self):
+        self.cancel_refresh()
+        self.files = []
+        self.prefetcher.schedule([])
+        self.withdraw()
+
+    def turn_page(self, step):
+        pages = max(1, -(-len(self.files) // REVIEW_TILES))
+        page = min(max(self.page + step, 0), pages - 1)
+        if page != self.page:
+            self.page = page
+            self.render()
+
+    def on_key(self, event):
+        if event.char.isdigit() and int(event.char) < len(self.files):
+            self.on_keep(int(event.char))
+        elif event.char.lower() == "s":
+            self.on_skip()
+        elif event.keysym == "Left":
+            self.turn_page(-1)
+        elif event.keysym == "Right":
+            self.turn_page(1)
+        elif event.keysym == "Escape":
+            self.on_stop()
+
+    def render(self):
+        start = self.page * REVIEW_TILES
+        page_files = self.files[start:start + REVIEW_TILES]
+        # This page first, then the rest of the group, then the next groups
+        self.prefetcher.schedule(page_files + self.files + self.upcoming)
+        self.pending.clear()
+        for slot, tile in enumerate(self.tiles):
+            if slot >= len(page_files):
+                self.images[slot] = None
+                tile["frame"].grid_remove()
+                continue
+            index = start + slot
+            path = page_files[slot]
+            tile["keep"].config(text=f"Keep [{index}]", command=lambda i=index: self.on_keep(i))
+            tile["play"].config(command=lambda p=path: self.on_play(p))
+            tile["name"].config(text=os.path.basename(path))
+            tile["folder"].config(text=os.path.dirname(path))
+            self.fill(slot, path)
+            tile["frame"].grid()
+        self.page_label.config(text=f"Files {start + 1}-{start + len(page_files)} of {len(self.files)}")
+        self.prev_button.config(state="normal" if start > 0 else "disabled")
+        self.next_button.config(state="normal" if start + REVIEW_TILES < len(self.files) else "disabled")
+        self.cancel_refresh()
+        if self.pending:
+            self.after_id = self.after(REVIEW_REFRESH_MS, self.refresh)
+
+    def fill(self, slot, path):
+        tile = self.tiles[slot]
+        preview = self.prefetcher.get(path)
+        if preview is None:
+            self.images[slot] = None
+            tile["image"].config(image=self.blank, text="Loading...")
+            tile["meta"].config(text="\n")
+            self.pending.add(slot)
+            return
+        photo = tk.PhotoImage(data=preview.thumbnail) if preview.thumbnail else self.blank
+        self.images[slot] = photo
+        tile["image"].config(image=photo, text="" if preview.thumbnail else "No preview")
+        tile["meta"].config(text=describe_preview(preview))
+
+    def refresh(self):
+        self.after_id = None
+        start = self.page * REVIEW_TILES
+        for slot in sorted(self.pending):
+            path = self.files[start + slot]
+            if self.prefetcher.get(path) is not None:
+                self.pending.discard(slot)
+                self.fill(slot, path)
+        if self.pending:
+            self.after_id = self.after(REVIEW_REFRESH_MS, self.refresh)
+
+    def cancel_refresh(self):
+        if self.after_id:
+            self.after_cancel(self.after_id)
+            self.after_id = None
+
+    def destroy(self):
+        self.cancel_refresh()
+        super().destroy()
+
+
+# How often the main loop drains the UI sink, and how many lines the on-screen
+# log keeps before dropping the oldest ones
+UI_FLUSH_MS = 100
+MAX_LOG_LINES = 5000
+
+
+class UISink:
+    # Thread-safe hand-off from scan threads to the Tk main loop. Log lines are
+    # buffered (the screen only ever needs the newest MAX_LOG_LINES; the spool
+    # file, if any, gets all of them) and progress updates are coalesced to the
+    # latest one. The main loop drains both on a timer.
+    def __init__(self, max_lines=MAX_LOG_LINES):
+        self.lock = threading.Lock()
+        self.lines = deque(maxlen=max_lines)
+        self.latest_progress = None
+        self.spool = None
+
+    def log(self, msg):
+        with self.lock:
+            self.lines.append(msg)
+            if self.spool:
+                self.spool.write(msg + "\n")
+
+    def put(self, item):
+        # Same interface as a progress queue; only the newest item matters
+        with self.lock:
+            self.latest_progress = item
+
+    def drain(self):
+        with self.lock:
+            lines = list(self.lines)
+            self.lines.clear()
+            progress, self.latest_progress = self.latest_progress, None
+        return lines, progress
+
+    def start_spool(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            if self.spool:
+                self.spool.close()
+            self.spool = open(path, "a", encoding="utf-8")
+
+    def stop_spool(self):
+        with self.lock:
+            if self.spool:
+                self.spool.close()
+                self.spool = None
 
 
 class DeDupGUI:
@@ -168,6 +369,13 @@ class DeDupGUI:
         self.root.title("🎬 Video De-Duplicator")
         self.root.geometry("850x600")
         self.mode = tk.StringVar(value="manual")
+        self.workers = tk.IntVar(value=default_worker_count())
+        self.match_mode = tk.StringVar(value="exact")
+        self.hamming_threshold = tk.IntVar(value=DEFAULT_HAMMING_THRESHOLD)
+        self.signature_frames = tk.IntVar(value=1)
+        self.spool_log = tk.BooleanVar(value=False)
+        self.profile_scan = tk.BooleanVar(value=False)
+        self.reclaim_mode = tk.StringVar(value="delete")
 
         # Light/Dark mode state
         self.dark_mode = tk.BooleanVar(value=False)
@@ -196,6 +404,8 @@ class DeDupGUI:
 
         self.create_widgets()
         self.apply_theme()  # Set initial theme
+        self.root.after(UI_FLUSH_MS, self.flush_ui)
+        self.root.after(500, self.offer_resume)
 
     def get_theme_colors(self):
         return self.styles["dark"] if self.dark_mode.get() else self.styles["light"]
@@ -209,6 +419,10 @@ class DeDupGUI:
         self.start_button = tk.Button(top_frame, text="Start Scan", command=self.start_scan, width=12)
         self.start_button.pack(side="left", padx=5)
 
+        # Merge signature shards scanned on other machines
+        self.merge_button = tk.Button(top_frame, text="Merge Shards", command=self.start_merge, width=12)
+        self.merge_button.pack(side="left", padx=5)
+
         # Kill Scan button
         self.kill_button = tk.Button(top_frame, text="Kill Scan", command=self.kill_scan, fg="red", state="disabled", width=12)
         self.kill_button.pack(side="left", padx=5)
@@ -217,6 +431,14 @@ class DeDupGUI:
         self.mode_toggle = tk.Checkbutton(top_frame, text="Dark Mode", variable=self.dark_mode, command=self.toggle_theme)
         self.mode_toggle.pack(side="left", padx=20)
 
+        # Full log spooling to a file
+        self.spool_toggle = tk.Checkbutton(top_frame, text="Save Full Log", variable=self.spool_log)
+        self.spool_toggle.pack(side="left", padx=5)
+
+        # Run the scan under cProfile
+        self.profile_toggle = tk.Checkbutton(top_frame, text="Profile Scan", variable=self.profile_scan)
+        self.profile_toggle.pack(side="left", padx=5)
+
         # Mode selection radios
         mode_frame = tk.Frame(self.root)
         mode_frame.pack(pady=5)
@@ -224,6 +446,27 @@ class DeDupGUI:
         tk.Radiobutton(mode_frame, text="Auto Delete", variable=self.mode, value="auto").pack(side="left", padx=15)
         tk.Radiobutton(mode_frame, text="Manual Review", variable=self.mode, value="manual").pack(side="left", padx=15)
 
+        # Worker process count
+        tk.Label(mode_frame, text="Workers:").pack(side="left", padx=(15, 2))
+        self.workers_spinbox = tk.Spinbox(mode_frame, from_=1, to=max(64, default_worker_count()),
+                                          textvariable=self.workers, width=4)
+        self.workers_spinbox.pack(side="left")
+
+        # Exact vs near-duplicate matching
+        match_frame = tk.Frame(self.root)
+        match_frame.pack(pady=5)
+
+        tk.Radiobutton(match_frame, text="Exact Match", variable=self.match_mode, value="exact").pack(side="left", padx=15)
+        tk.Radiobutton(match_frame, text="Near Match", variable=self.match_mode, value="near").pack(side="left", padx=15)
+        tk.Label(match_frame, text="Max Hamming:").pack(side="left", padx=(15, 2))
+        self.hamming_spinbox = tk.Spinbox(match_frame, from_=0, to=32, textvariable=self.hamming_threshold, width=4)
+        self.hamming_spinbox.pack(side="left")
+
+        # Number of frames sampled across the video for its signature
+        tk.Label(match_frame, text="Frames:").pack(side="left", padx=(15, 2))
+        self.frames_spinbox = tk.Spinbox(match_frame, from_=1, to=32, textvariable=self.signature_frames, width=4)
+        self.frames_spinbox.pack(side="left")
+
         # Folder path label
         self.folder_label = tk.Label(self.root, text="No folder selected", font=("Arial", 10, "bold"))
         self.folder_label.pack(pady=(10, 15))
@@ -239,19 +482,58 @@ class DeDupGUI:
         self.undo_button = tk.Button(bottom_frame, text="Undo Last Delete & Go Back", command=self.undo_last_delete, state="disabled", width=20)
         self.undo_button.pack(side="left", padx=10)
 
+        self.redo_button = tk.Button(bottom_frame, text="Redo", command=self.redo_delete, state="disabled", width=8)
+        self.redo_button.pack(side="left", padx=10)
+
         self.empty_bin_button = tk.Button(bottom_frame, text="Empty Recycle Bin", command=self.empty_recycle_bin, state="disabled", width=20)
         self.empty_bin_button.pack(side="left", padx=10)
 
+        self.stats_button = tk.Button(bottom_frame, text="Scan Stats", command=self.show_stats, state="disabled", width=12)
+        self.stats_button.pack(side="left", padx=10)
+
+        # What emptying the recycle bin does with each duplicate
+        reclaim_frame = tk.Frame(self.root)
+        reclaim_frame.pack(pady=(0, 10))
+
+        tk.Label(reclaim_frame, text="Empty bin by:").pack(side="left", padx=(0, 5))
+        tk.Radiobutton(reclaim_frame, text="Delete", variable=self.reclaim_mode, value="delete").pack(side="left", padx=10)
+        tk.Radiobutton(reclaim_frame, text="Hardlink to Kept", variable=self.reclaim_mode, value="hardlink").pack(side="left", padx=10)
+        tk.Radiobutton(reclaim_frame, text="Reflink to Kept", variable=self.reclaim_mode, value="reflink").pack(side="left", padx=10)
+
         # Initialize variables for scan
-        self.dupe_groups = []
+        self.dupe_groups = deque()
+        self.review_total = 0
         self.deleted_count = 0
         self.skipped_groups_stack = []
-        self.recycle_bin = []
         self.progress_popup = None
-        self.progress_queue = queue.Queue()
+        self.review_window = None
+        self.prefetcher = None
+        self.sink = UISink()
+        self.recycle_bin = self.open_recycle_bin()
+        self.scan_finished = threading.Event()
+        self.scan_result = {}
+        self.deletion_planned = threading.Event()
+        self.deletion_finished = threading.Event()
+        self.deletion_result = {}
+        self.last_stats = None
         self.kill_flag = threading.Event()
         self.current_group = None
-        self.last_deleted_group = None
+        if len(self.recycle_bin):
+            self.log(f"♻️ Restored {len(self.recycle_bin)} files marked for deletion in an earlier session.")
+        self.update_bin_buttons()
+
+    def open_recycle_bin(self):
+        # Marks are journaled to disk so a long review survives a restart
+        try:
+            return RecycleBin(default_recycle_bin_path())
+        except (OSError, ValueError) as e:
+            self.log(f"⚠️ Could not open saved recycle bin, marks will not be kept: {e}")
+            return RecycleBin()
+
+    def update_bin_buttons(self):
+        self.undo_button.config(state="normal" if self.recycle_bin.can_undo else "disabled")
+        self.redo_button.config(state="normal" if self.recycle_bin.can_redo else "disabled")
+        self.empty_bin_button.config(state="normal" if len(self.recycle_bin) else "disabled")
 
     def apply_theme(self):
         colors = self.get_theme_colors()
@@ -302,14 +584,67 @@ class DeDupGUI:
             colors = self.get_theme_colors()
             self.progress_popup.status_label.configure(bg=colors["bg"], fg=colors["fg"])
             self.progress_popup.fun_fact_label.configure(bg=colors["bg"])
+        if self.review_window:
+            self.review_window.apply_theme()
 
     # --- Rest of your existing methods below ---
 
     def log(self, msg):
+        # Safe from any thread; the text widget is updated by flush_ui
+        self.sink.log(msg)
+
+    def flush_ui(self):
+        lines, progress = self.sink.drain()
+        if lines:
+            self.output.configure(state="normal")
+            self.output.insert("end", "\n".join(lines) + "\n")
+            excess = int(self.output.index("end-1c").split(".")[0]) - 1 - MAX_LOG_LINES
+            if excess > 0:
+                self.output.delete("1.0", f"{excess + 1}.0")
+            self.output.yview("end")
+            self.output.configure(state="disabled")
+
+        if progress and self.progress_popup:
+            current, total, filename, discovered = progress
+            if total is not None:
+                self.progress_popup.progress['maximum'] = total
+            self.progress_popup.update_progress(current, total, filename, discovered)
+
+        if self.scan_finished.is_set():
+            self.scan_finished.clear()
+            self.finish_scan()
+
+        if self.deletion_planned.is_set():
+            self.deletion_planned.clear()
+            self.recycle_bin.clear()
+            self.update_bin_buttons()
+
+        if self.deletion_finished.is_set():
+            self.deletion_finished.clear()
+            self.finish_deletion()
+
+        self.root.after(UI_FLUSH_MS, self.flush_ui)
+
+    def reset_run(self):
+        self.sink.drain()
         self.output.configure(state="normal")
-        self.output.insert("end", msg + "\n")
-        self.output.yview("end")
+        self.output.delete(1.0, "end")
         self.output.configure(state="disabled")
+        if self.spool_log.get():
+            spool_path = os.path.join(default_cache_dir(), "logs", time.strftime("scan-%Y%m%d-%H%M%S.log"))
+            try:
+                self.sink.start_spool(spool_path)
+                self.log(f"Full log: {spool_path}")
+            except OSError as e:
+                self.log(f"⚠️ Could not open log file: {e}")
+        else:
+            self.sink.stop_spool()
+
+        # Reset kill flag and skipped groups; marked files stay in the
+        # recycle bin until it is emptied
+        self.kill_flag.clear()
+        self.skipped_groups_stack.clear()
+        self.update_bin_buttons()
 
     def start_scan(self):
         folder = filedialog.askdirectory(title="Select folder to scan")
@@ -317,56 +652,130 @@ class DeDupGUI:
             return
 
         self.folder_label.config(text=f"Folder Selected: {folder}")
-
-        self.output.configure(state="normal")
-        self.output.delete(1.0, "end")
-        self.output.configure(state="disabled")
+        self.reset_run()
         self.log(f"Selected folder: {folder}")
 
-        # Reset kill flag, recycle bin, undo states
-        self.kill_flag.clear()
-        self.recycle_bin.clear()
-        self.skipped_groups_stack.clear()
-        self.undo_button.config(state="disabled")
-        self.empty_bin_button.config(state="disabled")
-        self.last_deleted_group = None
-
         self.progress_popup = ProgressPopup(self.root, max_value=1, get_theme_colors=self.get_theme_colors)
         self.kill_button.config(state="normal")
-        threading.Thread(target=self.threaded_scan, args=(folder,), daemon=True).start()
-        self.root.after(100, self.update_progress_bar)
+        try:
+            workers = max(1, self.workers.get())
+        except tk.TclError:
+            workers = default_worker_count()
+        try:
+            hamming_threshold = max(0, self.hamming_threshold.get())
+        except tk.TclError:
+            hamming_threshold = DEFAULT_HAMMING_THRESHOLD
+        try:
+            frames = max(1, self.signature_frames.get())
+        except tk.TclError:
+            frames = 1
+        profile_path = None
+        if self.profile_scan.get():
+            profile_path = os.path.join(default_cache_dir(), "profiles", time.strftime("scan-%Y%m%d-%H%M%S.prof"))
+            os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+        self.last_stats = ScanStats()
+        self.stats_button.config(state="disabled")
+        threading.Thread(target=self.threaded_scan,
+                         args=(folder, workers, self.match_mode.get(), hamming_threshold, frames, profile_path),
+                         daemon=True).start()
+
+    def start_merge(self):
+        shards = filedialog.askopenfilenames(title="Select signature shards",
+                                             filetypes=[("Signature shards", f"*{SHARD_SUFFIX}"), ("All files", "*")])
+        if not shards:
+            return
+
+        self.folder_label.config(text=f"Shards Selected: {len(shards)}")
+        self.reset_run()
+        for shard in shards:
+            self.log(f"Selected shard: {shard}")
+        try:
+            hamming_threshold = max(0, self.hamming_threshold.get())
+        except tk.TclError:
+            hamming_threshold = DEFAULT_HAMMING_THRESHOLD
+        self.last_stats = None
+        self.stats_button.config(state="disabled")
+        threading.Thread(target=self.threaded_merge, args=(list(shards), self.match_mode.get(), hamming_threshold),
+                         daemon=True).start()
+
+    def threaded_merge(self, shards, match_mode="exact", hamming_threshold=DEFAULT_HAMMING_THRESHOLD):
+        try:
+            dupes = merge_shards(shards, self.log, match_mode=match_mode, hamming_threshold=hamming_threshold)
+        except (OSError, ValueError) as e:
+            self.log(f"❌ Merge failed: {e}")
+            dupes = {}
+        # Shards may list paths this machine cannot reach; only offer files
+        # that can actually be played and deleted from here.
+        reachable = {}
+        missing = 0
+        for key, files in dupes.items():
+            present = [f for f in files if os.path.exists(f)]
+            missing += len(files) - len(present)
+            if len(present) > 1:
+                reachable[key] = present
+        if missing:
+            self.log(f"⚠️ {missing} files from the shards are not reachable from this machine and were left out.")
+        self.scan_result = reachable
+        self.scan_finished.set()
 
     def kill_scan(self):
         self.kill_flag.set()
         self.kill_button.config(state="disabled")
         self.log("❌ Kill switch activated: stopping scan...")
 
-    def threaded_scan(self, folder):
-        dupes = scan_folder(folder, self.log, progress_queue=self.progress_queue, kill_flag=self.kill_flag)
-        self.dupe_groups = list(dupes.items())
+    def threaded_scan(self, folder, workers=1, match_mode="exact", hamming_threshold=DEFAULT_HAMMING_THRESHOLD,
+                      frames=1, profile_path=None):
+        dupes = find_duplicates(folder, self.log, workers=workers, match_mode=match_mode,
+                                hamming_threshold=hamming_threshold, frames=frames,
+                                progress_queue=self.sink, kill_flag=self.kill_flag,
+                                stats=self.last_stats, profile_path=profile_path)
+        # Hand the result to the main loop; no Tk calls from this thread
+        self.scan_result = dupes
+        self.scan_finished.set()
+
+    def finish_scan(self):
+        self.dupe_groups = deque(self.scan_result.items())
+        self.scan_result = {}
         self.deleted_count = 0
 
         if self.progress_popup:
-            self.root.after(0, self.progress_popup.destroy)
+            self.progress_popup.destroy()
             self.progress_popup = None
 
         self.kill_button.config(state="disabled")
+        self.stats_button.config(state="normal")
 
-        self.root.after(0, self.post_scan_actions)
+        self.post_scan_actions()
 
-    def update_progress_bar(self):
-        if not self.progress_popup:
+    def show_stats(self):
+        if not self.last_stats:
             return
-        try:
-            while True:
-                current, total, filename = self.progress_queue.get_nowait()
-                self.progress_popup.progress['maximum'] = total
-                self.progress_popup.update_progress(current, total, filename)
-        except queue.Empty:
-            pass
+        win = tk.Toplevel(self.root)
+        win.title("Scan Stats")
+        win.geometry("700x450")
 
-        if self.progress_popup:
-            self.root.after(100, self.update_progress_bar)
+        colors = self.get_theme_colors()
+        win.configure(bg=colors["bg"])
+
+        text = scrolledtext.ScrolledText(win, height=20, width=90, font=("Consolas", 10),
+                                         bg=colors["text_bg"], fg=colors["text_fg"])
+        text.pack(padx=10, pady=10, fill="both", expand=True)
+        text.insert("end", "\n".join(self.last_stats.summary_lines()))
+        text.configure(state="disabled")
+
+        tk.Button(win, text="Export JSON", command=self.export_stats,
+                  bg=colors["button_bg"], fg=colors["button_fg"], activebackground=colors["highlight_bg"], width=12).pack(pady=(0, 10))
+
+    def export_stats(self):
+        path = filedialog.asksaveasfilename(title="Export scan stats", defaultextension=".json",
+                                            filetypes=[("JSON", "*.json")])
+        if not path:
+            return
+        try:
+            self.last_stats.write_json(path)
+            self.log(f"📊 Scan stats written to {path}")
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to export stats: {e}")
 
     def post_scan_actions(self):
         if not self.dupe_groups:
@@ -378,6 +787,7 @@ class DeDupGUI:
             self.log(f"✅ Auto mode complete. {count} duplicates marked for deletion (in recycle bin).")
             self.ask_run_again()
         else:
+            self.review_total = len(self.dupe_groups)
             self.process_next_manual_group()
 
     def auto_delete_with_progress(self):
@@ -388,82 +798,71 @@ class DeDupGUI:
             if self.kill_flag.is_set():
                 self.log("❌ Auto deletion stopped by user.")
                 break
-            for f in files[1:]:
-                self.recycle_bin.append(f)
-                self.log(f"Marked for deletion: {f}")
-                count += 1
+            if any(f in self.recycle_bin for f in files):
+                self.log(f"Already reviewed, skipping group of {len(files)} files.")
+            else:
+                for f, _ in self.recycle_bin.mark([(f, files[0]) for f in files[1:]]):
+                    self.log(f"Marked for deletion: {f}")
+                    count += 1
             progress_win.update_progress(idx, total_groups, f"{len(files)} files in group")
             self.root.update_idletasks()
         progress_win.destroy()
-        self.empty_bin_button.config(state="normal")
-        self.undo_button.config(state="normal")
+        self.update_bin_buttons()
         return count
 
     def process_next_manual_group(self):
         if not self.dupe_groups:
+            if self.review_window:
+                self.review_window.hide()
             self.log(f"\n✅ Manual mode complete. {self.deleted_count} duplicates marked for deletion.")
             self.ask_run_again()
             return
 
-        key, files = self.dupe_groups.pop(0)
+        key, files = self.dupe_groups.popleft()
+        if any(f in self.recycle_bin for f in files):
+            # Decided before a restart; the marks came back with the bin
+            self.log(f"Already reviewed, skipping group of {len(files)} files.")
+            self.root.after_idle(self.process_next_manual_group)
+            return
         self.current_group = (key, files)
-        self.log(f"\nDuplicate Group: Hash={key[0]} | Duration={key[1]}s | Size={key[2]} bytes")
+        reclaimable = format_bytes(reclaimable_bytes(files))
+        self.log(f"\nDuplicate Group: Hash={key[0]} | Duration={key[1]}s | Size={key[2]} bytes"
+                 f" | Reclaimable={reclaimable}")
         for idx, f in enumerate(files):
             self.log(f" [{idx}] {f}")
-        self.prompt_user_for_manual_deletion(files)
-
-    def prompt_user_for_manual_deletion(self, files):
-        win = tk.Toplevel(self.root)
-        win.title("Select File to Keep")
-        win.geometry("600x400")
-
-        # Apply theme to this popup as well
-        colors = self.get_theme_colors()
-        win.configure(bg=colors["bg"])
-
-        label = tk.Label(win, text="Choose which file to KEEP:", font=("Arial", 12, "bold"), bg=colors["bg"], fg=colors["fg"])
-        label.pack(pady=5)
-
-        for idx, path in enumerate(files):
-            frame = tk.Frame(win, bg=colors["bg"])
-            frame.pack(fill="x", padx=5, pady=2)
-
-            tk.Button(frame, text=f"Keep [{idx}]", command=lambda i=idx: self.delete_except(files, i, win),
-                      bg=colors["button_bg"], fg=colors["button_fg"], activebackground=colors["highlight_bg"], width=10).pack(side="left")
-            tk.Button(frame, text="▶️", command=lambda p=path: self.play_video(p),
-                      bg=colors["button_bg"], fg=colors["button_fg"], activebackground=colors["highlight_bg"], width=3).pack(side="left", padx=4)
-
-            tk.Label(frame, text=os.path.basename(path), anchor="w", bg=colors["bg"], fg=colors["fg"]).pack(side="left", fill="x", expand=True)
-
-        btn_frame = tk.Frame(win, bg=colors["bg"])
-        btn_frame.pack(pady=10)
-
-        tk.Button(btn_frame, text="Skip Group", command=lambda: self.skip_group(win),
-                  bg=colors["button_bg"], fg=colors["button_fg"], activebackground=colors["highlight_bg"], width=12).pack(side="left", padx=5)
-        tk.Button(btn_frame, text="Stop Scanning", command=lambda: self.stop_manual_scan(win),
-                  bg=colors["button_bg"], fg=colors["button_fg"], activebackground=colors["highlight_bg"], width=12).pack(side="left", padx=5)
-
-    def delete_except(self, files, keep_index, win):
-        to_delete = [f for i, f in enumerate(files) if i != keep_index]
-        for f in to_delete:
-            self.recycle_bin.append(f)
+        upcoming = [f for _, group in islice(self.dupe_groups, PREFETCH_GROUPS) for f in group]
+        position = self.review_total - len(self.dupe_groups)
+        self.get_review_window().show(f"Group {position} of {self.review_total} ({reclaimable} reclaimable): "
+                                      f"choose which file to KEEP", files, upcoming)
+
+    def get_review_window(self):
+        # Built on first use and then only hidden, never rebuilt
+        if self.review_window is None or not self.review_window.winfo_exists():
+            if self.prefetcher is None:
+                self.prefetcher = Prefetcher()
+            self.review_window = ReviewWindow(self.root, self.get_theme_colors, self.prefetcher,
+                                              on_keep=self.delete_except, on_skip=self.skip_group,
+                                              on_stop=self.stop_manual_scan, on_play=self.play_video)
+        return self.review_window
+
+    def delete_except(self, keep_index):
+        key, files = self.current_group
+        to_delete = [(f, files[keep_index]) for i, f in enumerate(files) if i != keep_index]
+        for f, _ in self.recycle_bin.mark(to_delete):
             self.log(f"Marked for deletion: {f}")
             self.deleted_count += 1
-        self.undo_button.config(state="normal")
-        self.empty_bin_button.config(state="normal")
-        self.last_deleted_group = to_delete
-        win.destroy()
+        self.update_bin_buttons()
         self.process_next_manual_group()
 
-    def skip_group(self, win):
+    def skip_group(self):
         if self.current_group:
             self.skipped_groups_stack.append(self.current_group)
-        win.destroy()
         self.process_next_manual_group()
 
-    def stop_manual_scan(self, win):
+    def stop_manual_scan(self):
         self.log(f"❌ Manual scanning stopped. {self.deleted_count} files marked for deletion.")
-        win.destroy()
+        self.current_group = None
+        self.review_window.hide()
 
     def play_video(self, path):
         try:
@@ -477,29 +876,97 @@ class DeDupGUI:
             messagebox.showerror("Error", f"Failed to play video: {e}")
 
     def undo_last_delete(self):
-        if self.last_deleted_group:
-            for f in self.last_deleted_group:
-                if f in self.recycle_bin:
-                    self.recycle_bin.remove(f)
-                    self.log(f"Undo deletion: {f}")
-                    self.deleted_count -= 1
-            self.last_deleted_group = None
-            self.undo_button.config(state="disabled")
-            if not self.recycle_bin:
-                self.empty_bin_button.config(state="disabled")
+        for f, _ in self.recycle_bin.undo():
+            self.log(f"Undo deletion: {f}")
+            self.deleted_count -= 1
+        self.update_bin_buttons()
+
+    def redo_delete(self):
+        for f, _ in self.recycle_bin.redo():
+            self.log(f"Redo deletion: {f}")
+            self.deleted_count += 1
+        self.update_bin_buttons()
 
     def empty_recycle_bin(self):
-        if messagebox.askyesno("Confirm", "Permanently delete all marked duplicates from recycle bin?"):
-            for f in self.recycle_bin:
-                try:
-                    os.remove(f)
-                    self.log(f"Deleted file: {f}")
-                except Exception as e:
-                    self.log(f"Failed to delete {f}: {e}")
-            self.recycle_bin.clear()
-            self.empty_bin_button.config(state="disabled")
+        action = self.reclaim_mode.get()
+        prompts = {
+            "delete": "Permanently delete all marked duplicates from recycle bin?",
+            "hardlink": "Replace all marked duplicates with hardlinks to the kept copies?",
+            "reflink": "Replace all marked duplicates with copy-on-write clones of the kept copies?",
+        }
+        if not messagebox.askyesno("Confirm", prompts[action]):
+            return
+        self.undo_button.config(state="disabled")
+        self.redo_button.config(state="disabled")
+        self.empty_bin_button.config(state="disabled")
+        self.start_deletion(plan=(self.recycle_bin.items(), action))
+
+    def start_deletion(self, journals=(), plan=None):
+        # Planning (a stat per file plus an fsync) and the deletes both run
+        # off the main loop; flush_ui picks up the result. The popup grabs
+        # input, so nothing can be marked while the bin is being emptied.
+        self.kill_flag.clear()
+        self.kill_button.config(state="normal")
+        self.progress_popup = ProgressPopup(self.root, max_value=1, get_theme_colors=self.get_theme_colors,
+                                            title="Emptying recycle bin...", verb="Processing")
+        threading.Thread(target=self.threaded_deletion, args=(list(journals), plan), daemon=True).start()
+
+    def threaded_deletion(self, journals, plan=None):
+        result = {"failed": 0, "remaining": 0}
+        if plan is not None:
+            items, action = plan
+            self.log(f"📝 Saving deletion plan for {len(items)} files...")
+            try:
+                journals.append(DeletionJournal.create(items, action))
+            except OSError as e:
+                self.log(f"❌ Could not save the deletion plan, nothing was deleted: {e}")
+                result["error"] = True
+            else:
+                # The plan is on disk, so the bin can let go of the marks
+                self.deletion_planned.set()
+        try:
+            for journal in journals:
+                if self.kill_flag.is_set():
+                    break
+                summary = run_deletion(journal, self.log,
+                                       lambda done, total, path: self.sink.put((done, total, path, None)),
+                                       kill_flag=self.kill_flag)
+                result["failed"] += summary["failed"]
+        finally:
+            for journal in journals:
+                result["remaining"] += len(journal.pending())
+                journal.close()
+        self.deletion_result = result
+        self.deletion_finished.set()
+
+    def finish_deletion(self):
+        if self.progress_popup:
+            self.progress_popup.destroy()
+            self.progress_popup = None
+        self.kill_button.config(state="disabled")
+        self.update_bin_buttons()
+        result, self.deletion_result = self.deletion_result, {}
+        if result.get("error"):
+            return  # already logged; the marks are still in the bin
+        if result["remaining"]:
+            self.log("⏸️ Recycle bin only partly emptied; the rest will be offered again on the next start.")
+        elif result["failed"]:
+            self.log(f"⚠️ Recycle bin emptied with {result['failed']} failures (see log above).")
+        else:
             self.log("♻️ Recycle bin emptied.")
 
+    def offer_resume(self):
+        # Runs that were killed or crashed left their journal behind
+        journals = unfinished_journals()
+        if not journals:
+            return
+        pending = sum(len(j.pending()) for j in journals)
+        if messagebox.askyesno("Resume", f"A previous run left {pending} marked duplicates unprocessed.\nResume it now?"):
+            self.start_deletion(journals)
+        else:
+            for journal in journals:
+                journal.close()
+
     def ask_run_again(self):
         if messagebox.askyesno("Done", "Processing complete.\nDo you want to scan another folder?"):
             self.start_scan()
@@ -510,3 +977,5 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = DeDupGUI(root)
     root.mainloop()
+    if app.prefetcher is not None:
+        app.prefetcher.close()
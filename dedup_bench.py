@@ -0,0 +1,254 @@
+# Reproducible, offline benchmark for the scanning engine. Generates a
+# synthetic corpus with cv2.VideoWriter (exact copies, re-encodes, resized and
+# trimmed copies of a set of sources, plus unrelated unique clips across
+# several containers), runs find_duplicates over it and reports throughput,
+# stage timings, peak RSS and pairwise precision/recall against the known
+# ground truth.
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from itertools import combinations
+
+from dedup_core import find_duplicates, iter_video_files, default_worker_count, ScanStats
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# (extension, fourcc) pairs the corpus cycles through
+CONTAINERS = [(".mp4", "mp4v"), (".mkv", "XVID"), (".avi", "MJPG"), (".webm", "VP80")]
+VARIANTS = ["copy", "reencode", "resized", "trimmed"]
+FPS = 30
+
+
+def _source_frames(seed, frames, size):
+    # Smooth, slowly panning content so perceptual hashes behave like they do
+    # on real footage; every seed gives a different clip.
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    width, height = size
+    base = rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)
+    canvas = cv2.resize(base, (width * 2, height), interpolation=cv2.INTER_CUBIC)
+    for i in range(frames):
+        offset = int(i * width / frames)
+        yield canvas[:, offset:offset + width]
+
+
+def _write_clip(path, fourcc, frames):
+    import cv2
+    writer = None
+    try:
+        for frame in frames:
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), FPS, (width, height))
+                if not writer.isOpened():
+                    return False
+            writer.write(frame)
+    finally:
+        if writer is not None:
+            writer.release()
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def _resized(frames, scale):
+    import cv2
+    for frame in frames:
+        height, width = frame.shape[:2]
+        yield cv2.resize(frame, (int(width * scale) // 2 * 2, int(height * scale) // 2 * 2),
+                         interpolation=cv2.INTER_AREA)
+
+
+def generate_corpus(root, sources=20, uniques=20, seconds=3, size=(320, 240), seed=0):
+    # Returns {path: family}; files of the same family are true duplicates,
+    # unique clips get a family of their own.
+    rng = random.Random(seed)
+    truth = {}
+    frames = seconds * FPS
+    for src in range(sources):
+        family = f"src{src:04d}"
+        folder = os.path.join(root, f"set{src % 5}")
+        os.makedirs(folder, exist_ok=True)
+        ext, fourcc = CONTAINERS[src % len(CONTAINERS)]
+        original = os.path.join(folder, f"{family}_orig{ext}")
+        if not _write_clip(original, fourcc, _source_frames(seed * 100003 + src, frames, size)):
+            continue
+        truth[original] = family
+
+        copy_folder = os.path.join(root, "copies", f"set{rng.randrange(5)}")
+        os.makedirs(copy_folder, exist_ok=True)
+        copy_path = os.path.join(copy_folder, f"{family}_copy{ext}")
+        shutil.copyfile(original, copy_path)
+        truth[copy_path] = family
+
+        # Same frames in a different container/codec
+        ext2, fourcc2 = CONTAINERS[(src + 1) % len(CONTAINERS)]
+        path = os.path.join(folder, f"{family}_reencode{ext2}")
+        if _write_clip(path, fourcc2, _source_frames(seed * 100003 + src, frames, size)):
+            truth[path] = family
+
+        path = os.path.join(folder, f"{family}_resized{ext}")
+        if _write_clip(path, fourcc, _resized(_source_frames(seed * 100003 + src, frames, size), 0.5)):
+            truth[path] = family
+
+        # Drop the last half second
+        path = os.path.join(folder, f"{family}_trimmed{ext}")
+        if _write_clip(path, fourcc, _source_frames(seed * 100003 + src, frames - FPS // 2, size)):
+            truth[path] = family
+
+    for uid in range(uniques):
+        ext, fourcc = CONTAINERS[uid % len(CONTAINERS)]
+        folder = os.path.join(root, "unique")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"unique{uid:04d}{ext}")
+        if _write_clip(path, fourcc, _source_frames(seed * 100003 + 50000 + uid, frames, size)):
+            truth[path] = f"unique{uid:04d}"
+    return truth
+
+
+def _pairs(groups):
+    pairs = set()
+    for files in groups:
+        pairs.update(combinations(sorted(files), 2))
+    return pairs
+
+
+def score(dupes, truth):
+    families = {}
+    for path, family in truth.items():
+        families.setdefault(family, []).append(path)
+    expected = _pairs(families.values())
+    found = _pairs(dupes.values())
+    true_positives = len(expected & found)
+    precision = true_positives / len(found) if found else 1.0
+    recall = true_positives / len(expected) if expected else 1.0
+
+    # Fraction of each variant kind that ended up grouped with its original
+    grouped_with = {}
+    for files in dupes.values():
+        for path in files:
+            grouped_with[path] = set(files)
+    per_variant = {}
+    for variant in VARIANTS:
+        paths = [p for p in truth if f"_{variant}." in os.path.basename(p)]
+        hits = 0
+        for path in paths:
+            family = truth[path]
+            original = next((p for p in families[family] if "_orig." in os.path.basename(p)), None)
+            if original and original in grouped_with.get(path, ()):
+                hits += 1
+        per_variant[variant] = hits / len(paths) if paths else None
+    return {"precision": precision, "recall": recall, "true_pairs": len(expected),
+            "found_pairs": len(found), "variant_recall": per_variant}
+
+
+def peak_rss_mb(scan_stats):
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Hashing workers descend from the forkserver, not from this process, so
+    # RUSAGE_CHILDREN misses them; each worker reports its own peak instead
+    workers = scan_stats.worker_peak_rss
+    return {"self": own / divisor, "children": workers / (1024 * 1024) if workers is not None else None}
+
+
+def run_benchmark(corpus, truth, workers, match_mode, frames, cache_path):
+    stages = {}
+    start = time.perf_counter()
+    discovered = sum(1 for _ in iter_video_files(corpus))
+    stages["discovery"] = time.perf_counter() - start
+
+    scan_stats = ScanStats()
+    start = time.perf_counter()
+    dupes = find_duplicates(corpus, workers=workers, match_mode=match_mode, frames=frames,
+                            cache_path=cache_path, stats=scan_stats)
+    stages["scan_cold"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    find_duplicates(corpus, workers=workers, match_mode=match_mode, frames=frames, cache_path=cache_path)
+    stages["scan_warm"] = time.perf_counter() - start
+
+    return {
+        "files": discovered,
+        "workers": workers,
+        "match_mode": match_mode,
+        "frames": frames,
+        "stages_s": stages,
+        "cold_scan_stages_s": {stage: e["total_s"] for stage, e in scan_stats.to_dict()["stages"].items()},
+        "files_per_s_cold": discovered / stages["scan_cold"] if stages["scan_cold"] else None,
+        "files_per_s_warm": discovered / stages["scan_warm"] if stages["scan_warm"] else None,
+        "groups": len(dupes),
+        "accuracy": score(dupes, truth),
+        "peak_rss_mb": peak_rss_mb(scan_stats),
+    }
+
+
+def print_report(report, out):
+    print(f"Files: {report['files']}  workers: {report['workers']}  mode: {report['match_mode']}"
+          f"  frames: {report['frames']}", file=out)
+    for stage, seconds in report["stages_s"].items():
+        print(f"  {stage:<12} {seconds:8.3f} s", file=out)
+    for stage, seconds in sorted(report["cold_scan_stages_s"].items(), key=lambda kv: -kv[1]):
+        print(f"    {stage:<10} {seconds:8.3f} s", file=out)
+    print(f"  files/s cold {report['files_per_s_cold']:8.1f}", file=out)
+    print(f"  files/s warm {report['files_per_s_warm']:8.1f}", file=out)
+    acc = report["accuracy"]
+    print(f"  precision    {acc['precision']:8.3f}  ({acc['found_pairs']} pairs found)", file=out)
+    print(f"  recall       {acc['recall']:8.3f}  ({acc['true_pairs']} true pairs)", file=out)
+    for variant, value in acc["variant_recall"].items():
+        shown = "n/a" if value is None else f"{value:.3f}"
+        print(f"    {variant:<10} {shown:>8}", file=out)
+    rss = report["peak_rss_mb"]
+    if rss:
+        workers = "n/a" if rss["children"] is None else f"{rss['children']:.1f} MB"
+        print(f"  peak RSS     {rss['self']:8.1f} MB (workers {workers})", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="dedup_bench.py", description="Benchmark duplicate detection offline.")
+    parser.add_argument("--sources", type=int, default=20, help="source clips with variants (default: %(default)s)")
+    parser.add_argument("--uniques", type=int, default=20, help="unrelated clips (default: %(default)s)")
+    parser.add_argument("--seconds", type=int, default=3, help="clip length (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="corpus seed (default: %(default)s)")
+    parser.add_argument("-w", "--workers", type=int, action="append",
+                        help="worker counts to run (repeatable, default: 1 and all cores)")
+    parser.add_argument("-m", "--mode", choices=["exact", "near"], action="append",
+                        help="matching modes to run (repeatable, default: both)")
+    parser.add_argument("--frames", type=int, default=1, help="frames per signature (default: %(default)s)")
+    parser.add_argument("--corpus", metavar="DIR", help="generate the corpus into DIR and keep it")
+    parser.add_argument("--json", metavar="FILE", help="also write the reports as JSON")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="dedup-bench-")
+    corpus = args.corpus or os.path.join(workdir, "corpus")
+    try:
+        start = time.perf_counter()
+        truth = generate_corpus(corpus, args.sources, args.uniques, args.seconds, seed=args.seed)
+        print(f"Generated {len(truth)} files in {time.perf_counter() - start:.1f} s at {corpus}")
+
+        reports = []
+        for workers in args.workers or sorted({1, default_worker_count()}):
+            for mode in args.mode or ["exact", "near"]:
+                cache_path = os.path.join(workdir, f"cache-{workers}-{mode}.sqlite3")
+                report = run_benchmark(corpus, truth, workers, mode, args.frames, cache_path)
+                print_report(report, sys.stdout)
+                reports.append(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(reports, f, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
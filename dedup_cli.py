@@ -0,0 +1,220 @@
+# Headless command-line front end for the video de-duplicator. Never imports
+# tkinter, so it runs on servers and from cron. Progress goes to stderr and
+# duplicate groups go to stdout (or --output) as JSON Lines or CSV. With --watch
+# it keeps running and streams each group as soon as a new file completes it.
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+
+from dedup_core import (
+    find_duplicates,
+    merge_shards,
+    SHARD_SUFFIX,
+    ScanStats,
+    default_worker_count,
+    VIDEO_EXTENSIONS,
+    DEFAULT_HAMMING_THRESHOLD,
+    DEFAULT_DURATION_TOLERANCE,
+    DEFAULT_FILE_TIMEOUT,
+    reclaimable_bytes,
+)
+from dedup_watch import watch, WATCH_POLL_SECONDS
+
+CSV_FIELDS = ["group", "hash", "duration", "size", "reclaimable", "path"]
+
+
+def local_reclaimable(files):
+    # Only measurable when every copy is reachable here; merged shards usually
+    # list remote paths, and a missing file must not read as "frees nothing"
+    if not all(os.path.lexists(path) for path in files):
+        return None
+    return reclaimable_bytes(files)
+
+
+def group_records(dupes):
+    # reclaimable: bytes freed by keeping only the first file of the group,
+    # null when the files are not on this machine
+    for group_id, ((hash_val, duration, size), files) in enumerate(dupes.items(), 1):
+        yield {"group": group_id, "hash": hash_val, "duration": duration, "size": size,
+               "reclaimable": local_reclaimable(files), "files": files}
+
+
+def write_jsonl(dupes, out):
+    for record in group_records(dupes):
+        out.write(json.dumps(record) + "\n")
+
+
+def write_csv(dupes, out):
+    # One row per file so the output stays flat
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for record in group_records(dupes):
+        for path in record["files"]:
+            writer.writerow({**{k: record[k] for k in CSV_FIELDS[:-1]}, "path": path})
+
+
+WRITERS = {"jsonl": write_jsonl, "csv": write_csv}
+
+
+def normalize_extension(ext):
+    ext = ext.strip().lower()
+    return ext if ext.startswith(".") else "." + ext
+
+
+def parse_path_map(value):
+    source, sep, target = value.partition("=")
+    if not sep or not source:
+        raise argparse.ArgumentTypeError(f"expected FROM=TO, got {value!r}")
+    return source, target
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="dedup_cli.py",
+        description="Find duplicate videos by frame hash, duration and size.",
+    )
+    parser.add_argument("roots", nargs="+", help="folders to scan (signature shards with --merge)")
+    parser.add_argument("-e", "--ext", action="append", metavar="EXT",
+                        help=f"video extension to include (repeatable, default: {' '.join(VIDEO_EXTENSIONS)})")
+    parser.add_argument("-w", "--workers", type=int, default=default_worker_count(),
+                        help="number of hashing processes (default: %(default)s)")
+    parser.add_argument("-m", "--mode", choices=["exact", "near"], default="exact",
+                        help="matching mode (default: %(default)s)")
+    parser.add_argument("--hamming", type=int, default=DEFAULT_HAMMING_THRESHOLD,
+                        help="max Hamming distance per frame in near mode (default: %(default)s)")
+    parser.add_argument("--duration-tolerance", type=float, default=DEFAULT_DURATION_TOLERANCE,
+                        help="max duration difference in seconds in near mode (default: %(default)s)")
+    parser.add_argument("--frames", type=int, default=1,
+                        help="frames sampled per video for its signature (default: %(default)s)")
+    parser.add_argument("--no-prune", action="store_true",
+                        help="decode every file instead of skipping unique sizes and partial digests")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the signature cache")
+    parser.add_argument("--cache", metavar="PATH", help="signature cache file (default: user cache directory)")
+    parser.add_argument("--spill-dir", metavar="DIR",
+                        help="keep the in-scan signature table in memory-mapped files under DIR")
+    parser.add_argument("-f", "--format", choices=sorted(WRITERS), default="jsonl",
+                        help="output format (default: %(default)s)")
+    parser.add_argument("-o", "--output", metavar="FILE", help="write groups to FILE instead of stdout")
+    parser.add_argument("--stats", metavar="FILE", help="write per-stage timings and slowest files as JSON")
+    parser.add_argument("--hardlinks", metavar="FILE",
+                        help="write groups of files that are already hardlinks of each other as JSON Lines")
+    parser.add_argument("--profile", metavar="FILE", help="run the scan under cProfile and dump stats to FILE")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_FILE_TIMEOUT,
+                        help="seconds one file may take to decode before it is quarantined, 0 for no limit "
+                             "(default: %(default)s)")
+    parser.add_argument("--retry-quarantined", action="store_true",
+                        help="decode files again that failed, crashed or timed out in an earlier scan")
+    parser.add_argument("--no-isolate", action="store_true",
+                        help="decode in this process without deadlines or crash protection (for --profile)")
+    parser.add_argument("--write-shard", metavar="FILE",
+                        help=f"also save every signature to a shard (conventionally *{SHARD_SUFFIX}) for --merge")
+    parser.add_argument("--merge", action="store_true",
+                        help="treat the positional arguments as shards and group them without touching any video")
+    parser.add_argument("--map", action="append", metavar="FROM=TO", type=parse_path_map,
+                        help="in shards written or merged, rewrite paths starting with FROM to start with TO "
+                             "(repeatable)")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and report new duplicate groups as files arrive (exact mode, JSON Lines)")
+    parser.add_argument("--poll", action="store_true", help="with --watch, poll instead of using inotify")
+    parser.add_argument("--poll-interval", type=float, default=WATCH_POLL_SECONDS,
+                        help="seconds between polls with --watch (default: %(default)s)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only log errors and the final summary")
+    return parser
+
+
+def write_groups(dupes, args):
+    writer = WRITERS[args.format]
+    if args.output:
+        with open(args.output, "w", newline="", encoding="utf-8") as out:
+            writer(dupes, out)
+    else:
+        writer(dupes, sys.stdout)
+
+
+def run_watch(args, extensions, log):
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    hardlinks_out = open(args.hardlinks, "a", encoding="utf-8") if args.hardlinks else None
+
+    def on_group(key, files, new_path):
+        hash_val, duration, size = key
+        record = {"hash": hash_val, "duration": duration, "size": size, "reclaimable": reclaimable_bytes(files),
+                  "files": files, "new": new_path}
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+    def on_hardlink(size, paths):
+        if hardlinks_out is not None:
+            hardlinks_out.write(json.dumps({"size": size, "files": paths}) + "\n")
+            hardlinks_out.flush()
+
+    try:
+        watch(args.roots, log, on_group, extensions=extensions, workers=max(1, args.workers),
+              frames=max(1, args.frames), use_cache=not args.no_cache, cache_path=args.cache, poll=args.poll,
+              poll_interval=args.poll_interval, file_timeout=args.timeout, on_hardlink=on_hardlink)
+    except KeyboardInterrupt:
+        print("👋 Watch stopped.", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if hardlinks_out is not None:
+            hardlinks_out.close()
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    extensions = tuple(normalize_extension(e) for e in args.ext) if args.ext else VIDEO_EXTENSIONS
+
+    def log(msg):
+        if args.quiet and msg.startswith("Indexed file"):
+            return
+        print(msg, file=sys.stderr, flush=True)
+
+    if args.watch:
+        if args.mode != "exact" or args.format != "jsonl":
+            parser.error("--watch only supports --mode exact with --format jsonl")
+        return run_watch(args, extensions, log)
+
+    if args.merge:
+        try:
+            dupes = merge_shards(args.roots, log, match_mode=args.mode, hamming_threshold=args.hamming,
+                                 duration_tolerance=args.duration_tolerance, path_map=args.map,
+                                 spill_dir=args.spill_dir)
+        except (OSError, ValueError) as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 1
+        write_groups(dupes, args)
+        return 0
+
+    kill_flag = threading.Event()
+    stats = ScanStats() if args.stats or args.hardlinks else None
+    try:
+        dupes = find_duplicates(args.roots, log, extensions=extensions, workers=max(1, args.workers),
+                                match_mode=args.mode, hamming_threshold=args.hamming,
+                                duration_tolerance=args.duration_tolerance, frames=max(1, args.frames),
+                                prune=not args.no_prune, use_cache=not args.no_cache, cache_path=args.cache,
+                                kill_flag=kill_flag, stats=stats, profile_path=args.profile,
+                                spill_dir=args.spill_dir, shard_path=args.write_shard,
+                                path_map=args.map, file_timeout=args.timeout, isolate=not args.no_isolate,
+                                retry_quarantined=args.retry_quarantined)
+    except KeyboardInterrupt:
+        kill_flag.set()
+        print("❌ Scan interrupted.", file=sys.stderr)
+        return 130
+
+    if args.stats:
+        stats.write_json(args.stats)
+    if args.hardlinks:
+        with open(args.hardlinks, "w", encoding="utf-8") as out:
+            for size, paths in stats.hardlinks:
+                out.write(json.dumps({"size": size, "files": paths}) + "\n")
+    write_groups(dupes, args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
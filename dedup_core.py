@@ -0,0 +1,1797 @@
+# Scanning engine for the video de-duplicator. Everything here runs without a
+# display: the Tk front end lives in TheDeDuplicator.py and the command-line
+# front end in dedup_cli.py. OpenCV, NumPy, SciPy, Pillow and moviepy are
+# imported on first use so that importing this module stays cheap.
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import time
+import gzip
+import socket
+import sqlite3
+import hashlib
+import struct
+import signal
+import threading
+import queue
+import json
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager, ExitStack
+from functools import lru_cache
+from itertools import combinations
+
+# --- Scan instrumentation ---
+# Stage names recorded per file: stat, cache, open, decode, convert, phash,
+# duration. Scan-wide stages: walk, digest, group.
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+SLOWEST_FILES = 20
+
+
+@contextmanager
+def stage_timer(timings, stage):
+    # Adds the elapsed time to timings[stage]; a no-op when timings is None
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+class ScanStats:
+    # Per-stage timing histograms plus the slowest files of a scan. Safe to
+    # feed from several threads.
+    def __init__(self, slowest=SLOWEST_FILES):
+        self.lock = threading.Lock()
+        self.slowest_limit = slowest
+        self.stages = {}
+        self.slowest = []  # min-heap of (seconds, path, timings)
+        self.files = 0
+        self.skipped = []  # (path, reason) of quarantined files
+        self.hardlinks = []  # (size, paths) of files that already share an inode
+        self.worker_peak_rss = None  # bytes, largest reported by any hashing worker
+        self.started = time.time()
+        self.elapsed = None
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self._add(stage, seconds)
+
+    def _add(self, stage, seconds):
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = {"count": 0, "total": 0.0, "max": 0.0,
+                                          "buckets": [0] * (len(STAGE_BUCKETS) + 1)}
+        entry["count"] += 1
+        entry["total"] += seconds
+        entry["max"] = max(entry["max"], seconds)
+        entry["buckets"][bisect_left(STAGE_BUCKETS, seconds)] += 1
+
+    def add_file(self, path, timings, worker_rss=None):
+        total = sum(timings.values())
+        with self.lock:
+            self.files += 1
+            if worker_rss is not None:
+                self.worker_peak_rss = max(self.worker_peak_rss or 0, worker_rss)
+            for stage, seconds in timings.items():
+                self._add(stage, seconds)
+            item = (total, path, dict(timings))
+            if len(self.slowest) < self.slowest_limit:
+                heapq.heappush(self.slowest, item)
+            elif total > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def add_skipped(self, path, reason):
+        with self.lock:
+            self.skipped.append((path, reason))
+
+    def add_hardlinks(self, size, paths):
+        with self.lock:
+            self.hardlinks.append((size, list(paths)))
+
+    def finish(self):
+        self.elapsed = time.time() - self.started
+
+    def to_dict(self):
+        labels = [f"<={edge}s" for edge in STAGE_BUCKETS] + [f">{STAGE_BUCKETS[-1]}s"]
+        with self.lock:
+            stages = {
+                stage: {
+                    "count": e["count"],
+                    "total_s": e["total"],
+                    "mean_s": e["total"] / e["count"] if e["count"] else 0.0,
+                    "max_s": e["max"],
+                    "histogram": dict(zip(labels, e["buckets"])),
+                }
+                for stage, e in self.stages.items()
+            }
+            slowest = [{"path": path, "seconds": seconds, "stages": timings}
+                       for seconds, path, timings in sorted(self.slowest, reverse=True)]
+            skipped = [{"path": path, "reason": reason} for path, reason in self.skipped]
+            hardlinks = [{"size": size, "paths": paths} for size, paths in self.hardlinks]
+        return {"files": self.files, "elapsed_s": self.elapsed, "stages": stages, "slowest": slowest,
+                "skipped": skipped, "hardlinks": hardlinks, "worker_peak_rss_bytes": self.worker_peak_rss}
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary_lines(self):
+        data = self.to_dict()
+        lines = [f"Files timed: {data['files']}"]
+        if data["elapsed_s"] is not None:
+            lines[0] += f" in {data['elapsed_s']:.1f}s"
+        lines.append(f"{'stage':<10}{'count':>9}{'total s':>11}{'mean ms':>10}{'max ms':>10}")
+        for stage, e in sorted(data["stages"].items(), key=lambda kv: -kv[1]["total_s"]):
+            lines.append(f"{stage:<10}{e['count']:>9}{e['total_s']:>11.2f}"
+                         f"{e['mean_s'] * 1000:>10.1f}{e['max_s'] * 1000:>10.1f}")
+        if data["slowest"]:
+            lines.append("")
+            lines.append("Slowest files:")
+            for item in data["slowest"]:
+                worst = max(item["stages"].items(), key=lambda kv: kv[1])[0] if item["stages"] else "-"
+                lines.append(f"  {item['seconds'] * 1000:8.1f} ms  ({worst})  {item['path']}")
+        if data["skipped"]:
+            lines.append("")
+            lines.append(f"Skipped files ({len(data['skipped'])}):")
+            for item in data["skipped"]:
+                lines.append(f"  {item['path']}: {item['reason']}")
+        if data["hardlinks"]:
+            lines.append("")
+            lines.append(f"Already hardlinked, nothing to reclaim ({len(data['hardlinks'])} groups):")
+            for item in data["hardlinks"]:
+                lines.append(f"  {format_bytes(item['size']):>10}  {' = '.join(item['paths'])}")
+        return lines
+
+
+# --- Video signatures ---
+# A signature is a fixed-width array of 64-bit pHashes, one per sampled frame,
+# rendered as concatenated 16-digit hex strings for grouping and caching.
+SIGNATURE_KIND_FIRST_FRAME = "phash"
+HASH_IMG_SIZE = 32
+HASH_SIZE = 8
+
+
+@lru_cache(maxsize=None)
+def _dct_basis():
+    # First HASH_SIZE rows of the (unnormalised) DCT-II basis; scaling does not
+    # matter since bits are set by comparison against the median.
+    import numpy as np
+    return np.cos(np.pi * np.outer(np.arange(HASH_SIZE), 2 * np.arange(HASH_IMG_SIZE) + 1)
+                  / (2 * HASH_IMG_SIZE))
+
+
+def signature_kind(frames):
+    return SIGNATURE_KIND_FIRST_FRAME if frames <= 1 else f"temporal{frames}"
+
+
+def phash_batch(gray_batch):
+    # gray_batch: (N, 32, 32) array. Same bit layout as imagehash.phash.
+    import numpy as np
+    basis = _dct_basis()
+    low = basis @ np.asarray(gray_batch, dtype=np.float64) @ basis.T
+    flat = low.reshape(len(low), -1)
+    bits = flat > np.median(flat, axis=1, keepdims=True)
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+LUMA_STRIP_ROWS = 32
+
+
+def frame_to_luma(frame):
+    # BGR frame -> PIL "L" image. The luma is PIL's own fixed-point ITU-R 601
+    # formula, (R*19595 + G*38470 + B*7471 + 0x8000) >> 16, so the pixels match
+    # Image.fromarray(<RGB>).convert("L") exactly. It is computed straight
+    # from the OpenCV buffer a strip of rows at a time, so the only
+    # full-resolution image built is the luma itself.
+    import numpy as np
+    from PIL import Image
+    if frame.ndim == 2:
+        return Image.fromarray(frame)
+    height, width = frame.shape[:2]
+    luma = np.empty((height, width), dtype=np.uint8)
+    acc = np.empty((min(LUMA_STRIP_ROWS, height), width), dtype=np.uint32)
+    weighted = np.empty_like(acc)
+    for top in range(0, height, LUMA_STRIP_ROWS):
+        strip = frame[top:top + LUMA_STRIP_ROWS]
+        rows = len(strip)
+        a, w = acc[:rows], weighted[:rows]
+        np.multiply(strip[..., 2], 19595, out=a, dtype=np.uint32)
+        np.multiply(strip[..., 1], 38470, out=w, dtype=np.uint32)
+        a += w
+        np.multiply(strip[..., 0], 7471, out=w, dtype=np.uint32)
+        a += w
+        a += 0x8000
+        a >>= 16
+        luma[top:top + rows] = a
+    return Image.fromarray(luma)
+
+
+def luma_phash(luma):
+    # Bit-compatible with str(imagehash.phash(img)) for the image `luma` was
+    # converted from: same LANCZOS reduction and the same scipy DCT (a
+    # different DCT changes the bits of flat frames, whose coefficients are
+    # rounding noise), but no ImageHash objects.
+    import numpy as np
+    import scipy.fftpack
+    from PIL import Image
+    pixels = np.asarray(luma.resize((HASH_IMG_SIZE, HASH_IMG_SIZE), Image.LANCZOS))
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(pixels, axis=0), axis=1)
+    low = dct[:HASH_SIZE, :HASH_SIZE]
+    bits = np.packbits(low > np.median(low))
+    return bits.tobytes().hex()
+
+
+def signature_to_hex(signature):
+    return "".join(f"{int(h):016x}" for h in signature)
+
+
+def sample_gray_frames(cap, frames, timings=None):
+    # Seek to the middle of each of `frames` equal slices of the video instead
+    # of decoding sequentially; falls back to the previous frame on a failed seek.
+    import cv2
+    import numpy as np
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    grays = []
+    for i in range(frames):
+        with stage_timer(timings, "decode"):
+            if total > 0:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(total * (i + 0.5) / frames))
+            success, frame = cap.read()
+        if not success:
+            if not grays:
+                return None
+            grays.append(grays[-1])
+            continue
+        with stage_timer(timings, "convert"):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            grays.append(cv2.resize(gray, (HASH_IMG_SIZE, HASH_IMG_SIZE), interpolation=cv2.INTER_AREA))
+    return np.stack(grays)
+
+
+# --- Persistent signature cache ---
+# Signatures are keyed by (st_dev, st_ino) and considered stale when the size or
+# mtime_ns recorded alongside them no longer matches the file on disk.
+CACHE_FILENAME = "signatures.sqlite3"
+CACHE_MAX_ENTRIES = 2_000_000
+CACHE_COMMIT_EVERY = 500
+# Bump whenever the table layout or the meaning of a stored signature changes
+CACHE_SCHEMA_VERSION = 3
+
+
+def default_cache_dir():
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "DeDuplicator")
+
+
+class SignatureCache:
+    def __init__(self, path=None, max_entries=CACHE_MAX_ENTRIES):
+        if path is None:
+            path = os.path.join(default_cache_dir(), CACHE_FILENAME)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS signatures")
+            self.conn.execute(f"PRAGMA user_version={CACHE_SCHEMA_VERSION}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS signatures ("
+            " dev INTEGER NOT NULL, ino INTEGER NOT NULL, kind TEXT NOT NULL,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " path TEXT NOT NULL, hash TEXT NOT NULL, duration REAL NOT NULL,"
+            " last_seen REAL NOT NULL,"
+            " PRIMARY KEY (dev, ino, kind))"
+        )
+        # Files that crashed a worker, timed out or could not be decoded
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS quarantine ("
+            " dev INTEGER NOT NULL, ino INTEGER NOT NULL,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " path TEXT NOT NULL, reason TEXT NOT NULL, last_seen REAL NOT NULL,"
+            " PRIMARY KEY (dev, ino))"
+        )
+        self.conn.commit()
+        self.opened_at = time.time()
+
+    def get(self, path, st, kind=SIGNATURE_KIND_FIRST_FRAME):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, hash, duration FROM signatures WHERE dev=? AND ino=? AND kind=?",
+                (st.st_dev, st.st_ino, kind),
+            ).fetchone()
+            if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Refresh last_seen (and the path, in case the file was renamed)
+            self.conn.execute(
+                "UPDATE signatures SET last_seen=?, path=? WHERE dev=? AND ino=? AND kind=?",
+                (time.time(), path, st.st_dev, st.st_ino, kind),
+            )
+            self._maybe_commit()
+            return row[2], row[3]
+
+    def put(self, path, st, hash_val, duration, kind=SIGNATURE_KIND_FIRST_FRAME):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (st.st_dev, st.st_ino, kind, st.st_size, st.st_mtime_ns, path, hash_val, duration, time.time()),
+            )
+            # A file that decodes now (on a retry) leaves quarantine
+            self.conn.execute("DELETE FROM quarantine WHERE dev=? AND ino=?", (st.st_dev, st.st_ino))
+            self._maybe_commit()
+
+    def quarantined(self, st):
+        # Reason the file was quarantined, as long as it has not changed since
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, reason FROM quarantine WHERE dev=? AND ino=?", (st.st_dev, st.st_ino)
+            ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None
+        return row[2]
+
+    def quarantine(self, path, st, reason):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO quarantine VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, path, reason, time.time()),
+            )
+            self._maybe_commit()
+
+    def _maybe_commit(self):
+        self.pending += 1
+        if self.pending >= CACHE_COMMIT_EVERY:
+            self.conn.commit()
+            self.pending = 0
+
+    def evict(self, roots=None):
+        # Entries touched since the cache was opened belong to files that exist,
+        # so only the older ones need an existence check, and only under the
+        # roots just scanned (every root with roots=None): stat'ing the rest
+        # of a large cache after each scan of one folder is too slow on NFS.
+        # The LRU cap below bounds everything else.
+        removed = 0
+        if roots is None:
+            where, prefixes = "", [None]
+        else:
+            where = " AND substr(path, 1, ?) = ?"
+            prefixes = [os.path.join(os.fspath(root), "") for root in roots]
+        with self.lock:
+            for prefix in prefixes:
+                args = () if prefix is None else (len(prefix), prefix)
+                stale = self.conn.execute(
+                    "SELECT rowid, path FROM signatures WHERE last_seen < ?" + where, (self.opened_at, *args)
+                ).fetchall()
+                gone = [(rowid,) for rowid, path in stale if not os.path.exists(path)]
+                self.conn.executemany("DELETE FROM signatures WHERE rowid=?", gone)
+                removed += len(gone)
+                quarantined = self.conn.execute(
+                    "SELECT rowid, path FROM quarantine WHERE 1" + where, args
+                ).fetchall()
+                gone = [(rowid,) for rowid, path in quarantined if not os.path.exists(path)]
+                self.conn.executemany("DELETE FROM quarantine WHERE rowid=?", gone)
+                removed += len(gone)
+            count = self.conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+            if count > self.max_entries:
+                cur = self.conn.execute(
+                    "DELETE FROM signatures WHERE rowid IN ("
+                    " SELECT rowid FROM signatures ORDER BY last_seen LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                removed += cur.rowcount
+            self.conn.commit()
+            self.pending = 0
+        return removed
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0
+        return f"🗄️ Signature cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+# --- Metadata probe ---
+# Duration is read straight from the container header where the format is
+# known, so no ffmpeg process has to be spawned per file. OpenCV supplies the
+# stream properties and the first frame from the same open.
+MKV_SEGMENT = 0x18538067
+MKV_INFO = 0x1549A966
+MKV_CLUSTER = 0x1F43B675
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+
+ProbeResult = namedtuple("ProbeResult", "duration fps width height codec frame")
+
+
+def _mp4_duration(f):
+    # Walk top-level boxes to moov, then its children to mvhd
+    offset, parent_end = 0, os.fstat(f.fileno()).st_size
+    target = b"moov"
+    while offset + 8 <= parent_end:
+        f.seek(offset)
+        box_size, box_type = struct.unpack(">I4s", f.read(8))
+        header_len = 8
+        if box_size == 1:
+            box_size = struct.unpack(">Q", f.read(8))[0]
+            header_len = 16
+        elif box_size == 0:
+            box_size = parent_end - offset
+        if box_size < header_len:
+            return None
+        if box_type == target == b"moov":
+            offset, parent_end = offset + header_len, offset + box_size
+            target = b"mvhd"
+            continue
+        if box_type == target == b"mvhd":
+            version = f.read(4)[0]
+            if version == 1:
+                timescale, duration = struct.unpack(">16xIQ", f.read(28))
+            else:
+                timescale, duration = struct.unpack(">8xII", f.read(16))
+            return duration / timescale if timescale else None
+        offset += box_size
+    return None
+
+
+def _ebml_vint(f, keep_marker):
+    first = f.read(1)
+    if not first:
+        return None, 0
+    length, mask = 1, 0x80
+    while length <= 8 and not first[0] & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        return None, 0
+    value = first[0] if keep_marker else first[0] & (mask - 1)
+    for byte in f.read(length - 1):
+        value = (value << 8) | byte
+    return value, length
+
+
+def _mkv_duration(f):
+    timecode_scale = 1000000
+    offset, parent_end = 0, os.fstat(f.fileno()).st_size
+    while offset < parent_end:
+        f.seek(offset)
+        element_id, id_len = _ebml_vint(f, keep_marker=True)
+        size, size_len = _ebml_vint(f, keep_marker=False)
+        if element_id is None or size is None:
+            return None
+        data_start = offset + id_len + size_len
+        unknown_size = size == (1 << (7 * size_len)) - 1
+        if element_id in (MKV_SEGMENT, MKV_INFO):
+            # Descend into the element instead of skipping it
+            offset = data_start
+            if not unknown_size:
+                parent_end = min(parent_end, data_start + size)
+            continue
+        if element_id == MKV_CLUSTER or unknown_size:
+            return None  # media data reached before the Info element
+        if element_id == MKV_TIMECODE_SCALE:
+            timecode_scale = int.from_bytes(f.read(size), "big")
+        elif element_id == MKV_DURATION:
+            value = struct.unpack(">f" if size == 4 else ">d", f.read(size))[0]
+            return value * timecode_scale / 1e9
+        offset = data_start + size
+    return None
+
+
+def _avi_duration(f):
+    riff = f.read(12)
+    hdrl = f.read(12)
+    avih = f.read(28)
+    if riff[:4] != b"RIFF" or riff[8:] != b"AVI " or hdrl[8:] != b"hdrl" or avih[:4] != b"avih":
+        return None
+    usec_per_frame, _, _, _, total_frames = struct.unpack("<5I", avih[8:28])
+    return usec_per_frame * total_frames / 1e6
+
+
+CONTAINER_PARSERS = {
+    ".mp4": _mp4_duration,
+    ".mov": _mp4_duration,
+    ".mkv": _mkv_duration,
+    ".webm": _mkv_duration,
+    ".avi": _avi_duration,
+}
+
+
+def container_duration(path):
+    parser = CONTAINER_PARSERS.get(os.path.splitext(path)[1].lower())
+    if parser is None:
+        return None
+    try:
+        with open(path, "rb") as f:
+            duration = parser(f)
+    except (OSError, struct.error, IndexError, ValueError):
+        return None
+    return duration if duration and duration > 0 else None
+
+
+def fallback_duration(path):
+    # Last resort for streams without usable headers; this spawns ffmpeg
+    from moviepy import VideoFileClip
+    with VideoFileClip(path, audio=False) as clip:
+        return clip.duration
+
+
+class VideoProbe:
+    # A single open of a video file. Use it as a context manager so the
+    # capture is released on every path, including early returns and errors.
+    def __init__(self, path):
+        self.path = path
+        self.cap = None
+
+    def __enter__(self):
+        import cv2
+        self.cv2 = cv2
+        self.cap = cv2.VideoCapture(self.path)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        return False
+
+    @property
+    def fps(self):
+        return self.cap.get(self.cv2.CAP_PROP_FPS) or 0.0
+
+    @property
+    def width(self):
+        return int(self.cap.get(self.cv2.CAP_PROP_FRAME_WIDTH) or 0)
+
+    @property
+    def height(self):
+        return int(self.cap.get(self.cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+
+    @property
+    def codec(self):
+        fourcc = int(self.cap.get(self.cv2.CAP_PROP_FOURCC) or 0)
+        return "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00 ") or None
+
+    @property
+    def duration(self):
+        duration = container_duration(self.path)
+        if duration is None:
+            frame_count = self.cap.get(self.cv2.CAP_PROP_FRAME_COUNT) or 0
+            if frame_count > 0 and self.fps > 0:
+                duration = frame_count / self.fps
+        if duration is None:
+            duration = fallback_duration(self.path)
+        return duration
+
+    def first_frame(self):
+        # The first decoded frame is always a keyframe
+        success, frame = self.cap.read()
+        return frame if success else None
+
+
+def probe_video(path, read_frame=True, position=None):
+    # Stream metadata plus one frame from a single open, or None if the file
+    # cannot be opened. With `position` (a fraction of the duration) the frame
+    # is taken there instead of from the start, falling back to the first
+    # frame when the seek fails.
+    try:
+        with VideoProbe(path) as probe:
+            if not probe.cap.isOpened():
+                return None
+            duration = probe.duration
+            frame = None
+            if read_frame and position and duration:
+                probe.cap.set(probe.cv2.CAP_PROP_POS_MSEC, duration * 1000 * position)
+                success, frame = probe.cap.read()
+                if not success:
+                    frame = None
+                    probe.cap.set(probe.cv2.CAP_PROP_POS_FRAMES, 0)
+            if read_frame and frame is None:
+                frame = probe.first_frame()
+            return ProbeResult(duration, probe.fps, probe.width, probe.height, probe.codec, frame)
+    except Exception:
+        return None
+
+
+def compute_video_hash_duration(path, frames=1, timings=None):
+    # Pure decode step with no cache access, so it can run in a worker process.
+    # Stage timings are added to `timings` when a dict is passed.
+    try:
+        with ExitStack() as stack:
+            # Opened exactly once, and that one open is what "open" times
+            with stage_timer(timings, "open"):
+                probe = stack.enter_context(VideoProbe(path))
+            if frames > 1:
+                grays = sample_gray_frames(probe.cap, frames, timings)
+                if grays is None:
+                    return None, None
+                with stage_timer(timings, "phash"):
+                    img_hash = signature_to_hex(phash_batch(grays))
+            else:
+                with stage_timer(timings, "decode"):
+                    frame = probe.first_frame()
+                if frame is None:
+                    return None, None
+                with stage_timer(timings, "convert"):
+                    luma = frame_to_luma(frame)
+                del frame  # the full-resolution frame is not needed past this point
+                with stage_timer(timings, "phash"):
+                    img_hash = luma_phash(luma)
+            with stage_timer(timings, "duration"):
+                duration = probe.duration
+        if duration is None:
+            return None, None
+        return img_hash, round(duration, 1)
+    except Exception:
+        return None, None
+
+
+def peak_rss_bytes():
+    # Peak resident set size of this process, or None where getrusage is
+    # unavailable (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # KiB except on macOS
+
+
+def _hash_worker(path, frames):
+    # Worker process entry point; ships the stage timings and the worker's
+    # peak RSS back with the result. Workers are children of the forkserver,
+    # not of the scan, so the scan's RUSAGE_CHILDREN never sees them.
+    timings = {}
+    img_hash, duration = compute_video_hash_duration(path, frames, timings)
+    return img_hash, duration, timings, peak_rss_bytes()
+
+
+def get_video_hash_duration_size(path, cache=None, frames=1, st=None, timings=None):
+    try:
+        if st is None:
+            with stage_timer(timings, "stat"):
+                st = os.stat(path)
+        if cache is not None:
+            with stage_timer(timings, "cache"):
+                cached = cache.get(path, st, signature_kind(frames))
+            if cached is not None:
+                return cached[0], cached[1], st.st_size
+        img_hash, duration = compute_video_hash_duration(path, frames, timings)
+        if img_hash is None or duration is None:
+            return None, None, None
+        if cache is not None:
+            with stage_timer(timings, "cache"):
+                cache.put(path, st, img_hash, duration, signature_kind(frames))
+        return img_hash, duration, st.st_size
+    except Exception:
+        return None, None, None
+
+
+def default_worker_count():
+    return max(1, os.cpu_count() or 1)
+
+
+# --- Streaming discovery ---
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm')
+DISCOVERY_QUEUE_SIZE = 1024
+_DISCOVERY_DONE = object()
+_MISSING = object()
+
+
+def iter_video_files(folder, extensions=VIDEO_EXTENSIONS):
+    for path, st, _ in iter_video_entries(folder, extensions):
+        yield path, st
+
+
+def iter_video_entries(folder, extensions=VIDEO_EXTENSIONS):
+    # (path, stat, is_symlink) in the same order as a top-down os.walk that
+    # does not follow directory symlinks. The stat comes from the DirEntry,
+    # so it is fetched at most once (and for free on Windows).
+    extensions = tuple(ext.lower() for ext in extensions)
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.lower().endswith(extensions) and entry.is_file():
+                    yield entry.path, entry.stat(), entry.is_symlink()
+            except OSError:
+                continue
+        stack.extend(reversed(subdirs))
+
+
+def _contains(parent, path):
+    try:
+        return os.path.commonpath([parent, path]) == parent
+    except ValueError:
+        return False  # different drives
+
+
+def distinct_roots(roots):
+    # Splits roots into those to walk and those that repeat or sit inside
+    # another root, which would otherwise walk the same files twice
+    real = [os.path.realpath(root) for root in roots]
+    kept, dropped = [], []
+    for i, root in enumerate(roots):
+        covered = any(j != i and _contains(other, real[i]) and (other != real[i] or j < i)
+                      for j, other in enumerate(real))
+        (dropped if covered else kept).append(root)
+    return kept, dropped
+
+
+class LinkTracker:
+    # Drops further names of a file discovery has already yielded: hardlinks
+    # (same st_dev/st_ino) and file symlinks. Only files that can have another
+    # name are remembered (st_nlink > 1 or reached through a symlink), so
+    # ordinary files cost nothing. Hardlink groups are kept for reporting.
+    def __init__(self, roots, extensions=VIDEO_EXTENSIONS):
+        self.roots = [os.path.realpath(root) for root in roots]
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.first = {}      # (dev, ino) -> first path seen
+        self.hardlinks = {}  # (dev, ino) -> (size, [first path, other names...])
+        self.aliases = 0     # symlinks to files found anyway
+
+    def admit(self, path, st, is_link):
+        if is_link:
+            target = os.path.realpath(path)
+            if target.lower().endswith(self.extensions) and any(_contains(root, target) for root in self.roots):
+                # The walk reaches the target under its own name
+                self.aliases += 1
+                return False
+        elif st.st_nlink <= 1 or not st.st_ino:
+            # st_ino is 0 where scandir does not report it (Windows)
+            return True
+        key = (st.st_dev, st.st_ino)
+        first = self.first.get(key)
+        if first is None:
+            self.first[key] = path
+            return True
+        if is_link:
+            self.aliases += 1
+        else:
+            self.hardlinks.setdefault(key, (st.st_size, [first]))[1].append(path)
+        return False
+
+    def hardlink_groups(self):
+        return list(self.hardlinks.values())
+
+
+def freed_by_removing(path):
+    # A symlink, or a file with other hardlinks, frees nothing when removed
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return 0
+    if stat.S_ISLNK(st.st_mode) or st.st_nlink > 1:
+        return 0
+    return st.st_size
+
+
+def keep_linked_first(files):
+    # Copies whose removal frees nothing are the ones to keep: move them to
+    # the front, where auto delete keeps the first. Symlinks that reach a
+    # group point outside the scanned roots, so keeping one is safe.
+    # Otherwise the order is unchanged.
+    return sorted(files, key=lambda path: freed_by_removing(path) > 0)
+
+
+def reclaimable_bytes(files):
+    # Bytes actually freed by deleting every copy but files[0]
+    return sum(freed_by_removing(path) for path in files[1:])
+
+
+def fold_linked_names(files):
+    # Collapses names of the same file within a group (a symlink and its
+    # target, or hardlinks), keeping the first real name. stat follows
+    # symlinks, so all of them share the target's st_dev/st_ino. Paths that
+    # cannot be reached from here are kept as they are. Returns (files, names
+    # dropped).
+    names = {}  # (dev, ino) -> (is_symlink, path)
+    dropped = set()
+    for path in files:
+        try:
+            st = os.stat(path)
+            is_link = os.path.islink(path)
+        except OSError:
+            continue
+        if not st.st_ino:
+            continue  # no inode numbers here (Windows)
+        key = (st.st_dev, st.st_ino)
+        current = names.get(key)
+        if current is None:
+            names[key] = (is_link, path)
+        elif current[0] and not is_link:
+            dropped.add(current[1])
+            names[key] = (is_link, path)
+        else:
+            dropped.add(path)
+    return [path for path in files if path not in dropped], len(dropped)
+
+
+def _put_until_stopped(out_queue, item, stop_flags):
+    while not any(flag.is_set() for flag in stop_flags):
+        try:
+            out_queue.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def discover_video_files(roots, extensions, out_queue, *stop_flags, stats=None, links=None):
+    # Producer side of the bounded discovery queue; always ends with
+    # _DISCOVERY_DONE unless the scan was stopped. Time spent blocked on a
+    # full queue is not counted as walk time. With a LinkTracker, further
+    # names of an already discovered file are dropped here.
+    walk_time = 0.0
+    try:
+        for root in roots:
+            files = iter_video_entries(root, extensions)
+            while True:
+                start = time.perf_counter()
+                item = next(files, None)
+                while item is not None and links is not None and not links.admit(*item):
+                    item = next(files, None)
+                walk_time += time.perf_counter() - start
+                if item is None:
+                    break
+                path, st, _ = item
+                if not _put_until_stopped(out_queue, (path, st), stop_flags):
+                    return
+    finally:
+        if stats is not None:
+            stats.add("walk", walk_time)
+        _put_until_stopped(out_queue, _DISCOVERY_DONE, stop_flags)
+
+
+PARTIAL_DIGEST_CHUNK = 64 * 1024
+
+
+def partial_digest(path, size, chunk=PARTIAL_DIGEST_CHUNK):
+    # Digest of the head, middle and tail bytes; small files are read whole
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if size <= chunk * 3:
+            h.update(f.read())
+        else:
+            for offset in (0, size // 2 - chunk // 2, size - chunk):
+                f.seek(offset)
+                h.update(f.read(chunk))
+    return h.digest()
+
+
+class CandidateStream:
+    # Consumes the discovery queue and yields (idx, path, stat) for every file
+    # that needs decoding, where idx is the discovery order. Yields None when
+    # nothing arrived within `poll` seconds so callers can service other work.
+    #
+    # With pruning, files are held back until they can possibly be part of a
+    # group: first another file of the same byte size has to turn up (the
+    # duplicate key includes the size), then another one whose head, middle
+    # and tail bytes match as well. In a real library nearly every file is
+    # held back for the whole scan, so a held-back file is only a row number:
+    # its discovery index and path live in flat arrays, and it is stat'ed
+    # again when a peer releases it.
+    def __init__(self, discovery_queue, prune=True, kill_flag=None, poll=0.1, stats=None):
+        self.discovery_queue = discovery_queue
+        self.stats = stats
+        self.prune = prune
+        self.kill_flag = kill_flag
+        self.poll = poll
+        self.discovered = 0
+        self.size_shared = 0
+        self.emitted = 0
+        self.finished = False
+        self.by_size = {}    # size -> held row, or None once released
+        self.by_digest = {}  # (size, digest) -> held row, or None once released
+        self.held_idx = array("q")
+        self.held_offsets = array("q", [0])
+        self.held_paths = bytearray()
+
+    @property
+    def total(self):
+        # Number of files to decode; unknown until discovery has finished
+        return self.emitted if self.finished else None
+
+    def __iter__(self):
+        while not self.finished:
+            if self.kill_flag and self.kill_flag.is_set():
+                return
+            try:
+                item = self.discovery_queue.get(timeout=self.poll)
+            except queue.Empty:
+                yield None
+                continue
+            if item is _DISCOVERY_DONE:
+                self.finished = True
+                return
+            path, st = item
+            candidates = self._admit((self.discovered, path, st))
+            self.discovered += 1
+            for candidate in candidates:
+                self.emitted += 1
+                yield candidate
+
+    def _hold(self, item):
+        idx, path, _ = item
+        self.held_idx.append(idx)
+        self.held_paths += os.fsencode(path)
+        self.held_offsets.append(len(self.held_paths))
+        return len(self.held_idx) - 1
+
+    def _release(self, row):
+        # (idx, path, stat) again, or None if the file has gone meanwhile
+        path = os.fsdecode(bytes(self.held_paths[self.held_offsets[row]:self.held_offsets[row + 1]]))
+        try:
+            return self.held_idx[row], path, os.stat(path)
+        except OSError:
+            return None
+
+    def _pair(self, table, key, item):
+        # The items that this arrival makes worth looking at further
+        row = table.get(key, _MISSING)
+        if row is _MISSING:
+            table[key] = self._hold(item)
+            return []
+        table[key] = None
+        if row is None:
+            return [item]
+        first = self._release(row)
+        return [item] if first is None else [first, item]
+
+    def _admit(self, item):
+        if not self.prune:
+            return [item]
+        new = self._pair(self.by_size, item[2].st_size, item)
+        self.size_shared += len(new)
+        admitted = []
+        for candidate in new:
+            admitted.extend(self._admit_digest(candidate))
+        return admitted
+
+    def _admit_digest(self, item):
+        _, path, st = item
+        start = time.perf_counter()
+        try:
+            key = (st.st_size, partial_digest(path, st.st_size))
+        except OSError:
+            return []
+        finally:
+            if self.stats is not None:
+                self.stats.add("digest", time.perf_counter() - start)
+        return self._pair(self.by_digest, key, item)
+
+
+# --- Supervised hashing workers ---
+# Decoding runs in child processes the scan watches over. A worker that
+# crashes (a segfault in a codec) or runs past the per-file deadline (a hung
+# read or ffmpeg probe) is killed and replaced, and its file is quarantined
+# instead of stalling or taking down the scan.
+DEFAULT_FILE_TIMEOUT = 120.0
+
+
+def _supervised_worker(conn, frames, job=None):
+    # Own process group, so killing the worker also kills any ffmpeg it started
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    while True:
+        try:
+            path = conn.recv()
+        except (EOFError, OSError):
+            return
+        if path is None:
+            return
+        try:
+            result = job(path) if job is not None else _hash_worker(path, frames)
+        except Exception:
+            if job is not None:
+                raise  # takes the worker down; the pool reports it as a crash
+            result = (None, None, {}, None)
+        conn.send(result)
+
+
+def _worker_context():
+    # Never fork: the scanning process already runs threads (discovery, and Tk
+    # plus the preview prefetcher in the GUI), and a forked child can inherit
+    # a lock one of them held. forkserver forks from a clean single-threaded
+    # server; spawn where that is unavailable (Windows).
+    import multiprocessing
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+class _HashWorker:
+    def __init__(self, frames, job=None):
+        context = _worker_context()
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_supervised_worker, args=(child_conn, frames, job), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.started = None
+
+    def send(self, task, path):
+        self.conn.send(path)
+        self.task = task
+        self.started = time.monotonic()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            self.process.kill()  # not a group leader (yet), or not POSIX
+        self.process.join()
+        self.conn.close()
+
+
+class HashWorkerPool:
+    # Up to `workers` supervised processes, started on demand. submit() hands
+    # a file to an idle worker; poll() returns (task, result, failure) for
+    # every file that finished, where failure is None or a reason string.
+    # Workers hash files unless given a `job`, a module-level function called
+    # as job(path) whose return value is the result.
+    def __init__(self, workers=1, frames=1, timeout=DEFAULT_FILE_TIMEOUT, job=None):
+        self.size = max(1, workers)
+        self.frames = frames
+        self.timeout = timeout
+        self.job = job
+        self.workers = []
+
+    @property
+    def busy(self):
+        return sum(1 for w in self.workers if w.task is not None)
+
+    def has_capacity(self):
+        return self.busy < self.size
+
+    def submit(self, task, path):
+        worker = next((w for w in self.workers if w.task is None), None)
+        if worker is None:
+            worker = _HashWorker(self.frames, self.job)
+            self.workers.append(worker)
+        worker.send(task, path)
+
+    def _replace(self, worker):
+        worker.kill()
+        self.workers.remove(worker)
+
+    def poll(self, timeout=0.2):
+        from multiprocessing.connection import wait as wait_ready
+        busy = [w for w in self.workers if w.task is not None]
+        if not busy:
+            return []
+        ready = set(wait_ready([w.conn for w in busy] + [w.process.sentinel for w in busy], timeout))
+        now = time.monotonic()
+        finished = []
+        for worker in busy:
+            task = worker.task
+            if worker.conn in ready:
+                try:
+                    result = worker.conn.recv()
+                except (EOFError, OSError):
+                    result = None
+                if result is not None:
+                    worker.task = None
+                    finished.append((task, result, None))
+                    continue
+            elif worker.process.sentinel not in ready and not (self.timeout and now - worker.started > self.timeout):
+                continue
+            if worker.process.is_alive() and self.timeout and now - worker.started > self.timeout:
+                failure = f"timed out after {self.timeout:g}s"
+            else:
+                worker.process.join(0.1)
+                failure = f"worker crashed (exit code {worker.process.exitcode})"
+            self._replace(worker)
+            finished.append((task, None, failure))
+        return finished
+
+    def cancel(self):
+        # Kills whatever is still decoding but keeps idle workers for reuse
+        for worker in [w for w in self.workers if w.task is not None]:
+            self._replace(worker)
+
+    def close(self):
+        # Idle workers are asked to exit; busy ones are killed mid-decode
+        for worker in self.workers:
+            if worker.task is None:
+                worker.stop()
+            else:
+                worker.kill()
+        self.workers = []
+
+
+def _lookup(full_path, st, cache, kind, retry_quarantined, timings):
+    # (cached signature, quarantine reason); at most one of them is set
+    if cache is None:
+        return None, None
+    with stage_timer(timings, "cache"):
+        cached = cache.get(full_path, st, kind)
+        if cached is not None or retry_quarantined:
+            return cached, None
+        return None, cache.quarantined(st)
+
+
+def _hash_files_serial(candidates, report, skip, cache, frames, store, retry_quarantined=False):
+    # In-process decoding without a deadline; meant for debugging and profiling
+    kind = signature_kind(frames)
+    for candidate in candidates:
+        if candidate is None:
+            continue
+        idx, full_path, st = candidate
+        timings = {}
+        cached, reason = _lookup(full_path, st, cache, kind, retry_quarantined, timings)
+        if cached is not None:
+            store.append(idx, full_path, cached[0], cached[1], st.st_size, st.st_mtime_ns)
+        elif reason is not None:
+            skip(full_path, f"quarantined earlier: {reason}")
+        else:
+            img_hash, duration = compute_video_hash_duration(full_path, frames, timings)
+            if img_hash is None or duration is None:
+                _quarantine(full_path, st, "could not be decoded", cache, skip)
+            else:
+                if cache is not None:
+                    with stage_timer(timings, "cache"):
+                        cache.put(full_path, st, img_hash, duration, kind)
+                store.append(idx, full_path, img_hash, duration, st.st_size, st.st_mtime_ns)
+        report(full_path, timings)
+
+
+def _quarantine(full_path, st, reason, cache, skip):
+    if cache is not None:
+        cache.quarantine(full_path, st, reason)
+    skip(full_path, reason)
+
+
+def _hash_files_pool(candidates, report, skip, kill_flag, cache, workers, frames, store, timeout,
+                     retry_quarantined=False, pool=None):
+    kind = signature_kind(frames)
+    stream = iter(candidates)
+    exhausted = False
+    owned = pool is None
+    if owned:
+        pool = HashWorkerPool(workers, frames, timeout)
+    try:
+        while not exhausted or pool.busy:
+            if kill_flag and kill_flag.is_set():
+                return  # closing the pool kills whatever is still decoding
+
+            while not exhausted and pool.has_capacity():
+                candidate = next(stream, _DISCOVERY_DONE)
+                if candidate is _DISCOVERY_DONE:
+                    exhausted = True
+                    break
+                if candidate is None:
+                    break  # discovery has nothing new yet; service the pool
+                idx, full_path, st = candidate
+                timings = {}
+                cached, reason = _lookup(full_path, st, cache, kind, retry_quarantined, timings)
+                if cached is not None:
+                    store.append(idx, full_path, cached[0], cached[1], st.st_size, st.st_mtime_ns)
+                    report(full_path, timings)
+                elif reason is not None:
+                    skip(full_path, f"quarantined earlier: {reason}")
+                    report(full_path, timings)
+                else:
+                    pool.submit(candidate, full_path)
+
+            for (idx, full_path, st), result, failure in pool.poll(0.2):
+                img_hash, duration, timings, worker_rss = result or (None, None, {}, None)
+                if failure is not None or img_hash is None or duration is None:
+                    _quarantine(full_path, st, failure or "could not be decoded", cache, skip)
+                else:
+                    if cache is not None:
+                        with stage_timer(timings, "cache"):
+                            cache.put(full_path, st, img_hash, duration, kind)
+                    store.append(idx, full_path, img_hash, duration, st.st_size, st.st_mtime_ns)
+                report(full_path, timings, worker_rss)
+    finally:
+        if owned:
+            pool.close()
+        else:
+            pool.cancel()
+
+
+def hash_candidates(candidates, store, cache=None, workers=1, frames=1, report=None, kill_flag=None, skip=None,
+                    file_timeout=DEFAULT_FILE_TIMEOUT, isolate=True, retry_quarantined=False, pool=None):
+    # Hashes (idx, path, stat) candidates into a SignatureStore using up to
+    # `workers` supervised processes. Files that crash a worker, run past
+    # file_timeout seconds (0 for no deadline) or cannot be decoded are passed
+    # to skip(path, reason) and quarantined in the cache, so later scans skip
+    # them until they change. isolate=False decodes in this process instead.
+    # report(path, timings, worker_rss) gets the peak RSS in bytes of the
+    # worker that decoded the file, when one did. A long-lived caller can pass its own HashWorkerPool, whose workers then
+    # stay up between calls (workers and file_timeout come from the pool).
+    report = report or (lambda full_path, timings, worker_rss=None: None)
+    skip = skip or (lambda full_path, reason: None)
+    if isolate:
+        _hash_files_pool(candidates, report, skip, kill_flag, cache, workers, frames, store, file_timeout,
+                         retry_quarantined, pool)
+    else:
+        _hash_files_serial(candidates, report, skip, cache, frames, store, retry_quarantined)
+
+
+# --- Near-duplicate matching ---
+DEFAULT_HAMMING_THRESHOLD = 8
+DEFAULT_DURATION_TOLERANCE = 1.0
+# Durations are compared and stored as fixed-point tenths of a second,
+# matching the rounding applied when they are measured
+DURATION_SCALE = 10
+
+
+class MultiIndexHash:
+    # Multi-index hashing over signatures of `hash_bits` bits. The hash is
+    # split into 16-bit chunks; by the pigeonhole principle two hashes within
+    # `radius` bits differ by at most radius // chunks bits in at least one
+    # chunk, so only those chunk neighbours need to be looked up.
+    CHUNK_BITS = 16
+
+    def __init__(self, radius, hash_bits=64):
+        self.radius = radius
+        self.chunk_bits = self.CHUNK_BITS
+        self.chunk_mask = (1 << self.chunk_bits) - 1
+        self.chunks = max(1, hash_bits // self.chunk_bits)
+        chunk_radius = radius // self.chunks
+        self.flip_masks = [0]
+        for r in range(1, chunk_radius + 1):
+            for bits in combinations(range(self.chunk_bits), r):
+                self.flip_masks.append(sum(1 << b for b in bits))
+        self.tables = [defaultdict(list) for _ in range(self.chunks)]
+
+    def _chunks(self, value):
+        for i in range(self.chunks):
+            yield i, (value >> (i * self.chunk_bits)) & self.chunk_mask
+
+    def add(self, value):
+        for i, chunk in self._chunks(value):
+            self.tables[i][chunk].append(value)
+
+    def query(self, value):
+        matches = set()
+        for i, chunk in self._chunks(value):
+            table = self.tables[i]
+            for flip in self.flip_masks:
+                for candidate in table.get(chunk ^ flip, ()):
+                    if (candidate ^ value).bit_count() <= self.radius:
+                        matches.add(candidate)
+        return matches
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # Lower index wins so the representative is the first file found
+            if rb < ra:
+                ra, rb = rb, ra
+            self.parent[rb] = ra
+
+
+def group_near_duplicates(entries, hamming_threshold=DEFAULT_HAMMING_THRESHOLD,
+                          duration_tolerance=DEFAULT_DURATION_TOLERANCE):
+    # entries: list of (path, hash_hex, duration, size) in discovery order
+    # Integer tenths, so a pair exactly at the tolerance always matches
+    # (in floats 2.2 - 1.2 > 1.0 while 10.3 - 9.3 <= 1.0)
+    tolerance = round(duration_tolerance * DURATION_SCALE)
+    buckets = defaultdict(list)
+    hash_bits = 64
+    for idx, (_, hash_val, duration, _) in enumerate(entries):
+        buckets[int(hash_val, 16)].append((round(duration * DURATION_SCALE), idx))
+        hash_bits = len(hash_val) * 4
+    bucket_keys = list(buckets)
+    index = MultiIndexHash(hamming_threshold, hash_bits)
+    for key in bucket_keys:
+        buckets[key].sort()
+        index.add(key)
+
+    uf = UnionFind(len(entries))
+    for key in bucket_keys:
+        for other in index.query(key):
+            if other < key:
+                continue  # each pair of buckets only once
+            # Every file in the two buckets is within the Hamming threshold, so
+            # along the duration axis the components are runs of neighbours
+            # no further apart than the tolerance.
+            merged = sorted(buckets[key] + buckets[other]) if other != key else buckets[key]
+            for (d1, i1), (d2, i2) in zip(merged, merged[1:]):
+                if d2 - d1 <= tolerance:
+                    uf.union(i1, i2)
+
+    components = defaultdict(list)
+    for idx in range(len(entries)):
+        components[uf.find(idx)].append(idx)
+
+    dupes = {}
+    for root_idx in sorted(components):
+        members = components[root_idx]
+        if len(members) > 1:
+            _, hash_val, duration, size = entries[root_idx]
+            dupes[(hash_val, duration, size)] = [entries[i][0] for i in members]
+    return dupes
+
+
+# --- Columnar signature store ---
+STORE_INITIAL_CAPACITY = 4096
+
+
+class SignatureStore:
+    # Holds one row per hashed file in NumPy columns: discovery index, the
+    # signature as `hash_words` uint64 words, fixed-point duration, size and
+    # mtime.
+    # Paths are interned in a single byte table addressed by offset, so a
+    # multi-million-file scan costs a few dozen bytes per file instead of
+    # several Python objects. With spill_dir the columns are memory-mapped
+    # files in a private directory under spill_dir instead of RAM.
+    def __init__(self, hash_words=1, spill_dir=None, capacity=STORE_INITIAL_CAPACITY):
+        import numpy as np
+        self.np = np
+        self.hash_words = hash_words
+        self.count = 0
+        self.path_bytes = 0
+        self.spill_dir = tempfile.mkdtemp(prefix="dedup-store-", dir=spill_dir) if spill_dir else None
+        self.columns = {
+            "idx": (np.int64, ()),
+            "hashes": (np.uint64, (hash_words,)),
+            "durations": (np.int32, ()),
+            "sizes": (np.int64, ()),
+            "mtimes": (np.int64, ()),
+            "path_offsets": (np.int64, ()),
+            "path_lengths": (np.int32, ()),
+        }
+        self.capacity = 0
+        self.path_capacity = 0
+        self.paths = None
+        for name in self.columns:
+            setattr(self, name, None)
+        self._grow(capacity)
+        self._grow_paths(capacity * 64)
+
+    def _alloc(self, name, dtype, shape):
+        if self.spill_dir is None:
+            return self.np.zeros(shape, dtype=dtype)
+        path = os.path.join(self.spill_dir, f"{name}-{shape[0]}.bin")
+        return self.np.memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+    def _release(self, array):
+        if self.spill_dir is not None and isinstance(array, self.np.memmap):
+            filename = array.filename
+            array._mmap.close()
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def _grow(self, capacity):
+        for name, (dtype, shape) in self.columns.items():
+            old = getattr(self, name)
+            new = self._alloc(name, dtype, (capacity,) + shape)
+            if old is not None:
+                new[:self.count] = old[:self.count]
+                self._release(old)
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def _grow_paths(self, capacity):
+        old = self.paths
+        new = self._alloc("paths", self.np.uint8, (capacity,))
+        if old is not None:
+            new[:self.path_bytes] = old[:self.path_bytes]
+            self._release(old)
+        self.paths = new
+        self.path_capacity = capacity
+
+    def __len__(self):
+        return self.count
+
+    def append(self, idx, path, hash_hex, duration, size, mtime_ns=0):
+        if self.count == self.capacity:
+            self._grow(self.capacity * 2)
+        encoded = os.fsencode(path)
+        if self.path_bytes + len(encoded) > self.path_capacity:
+            self._grow_paths(max(self.path_capacity * 2, self.path_bytes + len(encoded)))
+        row = self.count
+        self.idx[row] = idx
+        for word in range(self.hash_words):
+            self.hashes[row, word] = int(hash_hex[word * 16:(word + 1) * 16], 16)
+        self.durations[row] = round(duration * DURATION_SCALE)
+        self.sizes[row] = size
+        self.mtimes[row] = mtime_ns
+        self.path_offsets[row] = self.path_bytes
+        self.path_lengths[row] = len(encoded)
+        self.paths[self.path_bytes:self.path_bytes + len(encoded)] = self.np.frombuffer(encoded, dtype=self.np.uint8)
+        self.path_bytes += len(encoded)
+        self.count += 1
+
+    def path(self, row):
+        start = int(self.path_offsets[row])
+        return os.fsdecode(self.paths[start:start + int(self.path_lengths[row])].tobytes())
+
+    def hash_hex(self, row):
+        return "".join(f"{int(word):016x}" for word in self.hashes[row])
+
+    def key(self, row):
+        return self.hash_hex(row), int(self.durations[row]) / DURATION_SCALE, int(self.sizes[row])
+
+    def rows(self):
+        # Row numbers in discovery order
+        return self.np.argsort(self.idx[:self.count], kind="stable")
+
+    def entries(self):
+        # (path, hash, duration, size) in discovery order
+        for row in self.rows():
+            yield (self.path(row),) + self.key(row)
+
+    def exact_groups(self):
+        # Vectorised sort-and-split: lexsort on (size, duration, hash words)
+        # with the discovery index as the final tie-breaker, then cut wherever
+        # the key changes. Python objects are only built for real groups.
+        np = self.np
+        n = self.count
+        if n < 2:
+            return {}
+        key_columns = [self.sizes[:n], self.durations[:n]] + [self.hashes[:n, w] for w in range(self.hash_words)]
+        order = np.lexsort([self.idx[:n]] + key_columns[::-1])
+        changed = np.zeros(n - 1, dtype=bool)
+        for column in key_columns:
+            ordered = column[order]
+            changed |= ordered[1:] != ordered[:-1]
+        starts = np.flatnonzero(np.concatenate(([True], changed)))
+        ends = np.append(starts[1:], n)
+        multi = (ends - starts) > 1
+        groups = [order[s:e] for s, e in zip(starts[multi], ends[multi])]
+        # Report groups in the order their first file was discovered
+        groups.sort(key=lambda rows: int(self.idx[rows[0]]))
+        return {self.key(rows[0]): [self.path(row) for row in rows] for rows in groups}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for name in self.columns:
+            self._release(getattr(self, name))
+            setattr(self, name, None)
+        self._release(self.paths)
+        self.paths = None
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+# --- Signature shards ---
+# A shard is the signature table of one scan, written as gzip-compressed JSON
+# Lines: a header object, then one object per decoded file. Shards scanned on
+# different machines merge into global duplicate groups without opening a
+# single video again.
+SHARD_FORMAT = "dedup-shard"
+SHARD_VERSION = 1
+SHARD_SUFFIX = ".dshard"
+
+
+def write_shard(path, store, roots, frames=1, path_map=None):
+    # path_map lets a node record its files under the paths another machine
+    # will see them at (see remap_path)
+    path_map = sorted(path_map or [], key=lambda pair: -len(pair[0]))
+    header = {
+        "format": SHARD_FORMAT,
+        "version": SHARD_VERSION,
+        "signature": signature_kind(frames),
+        "frames": frames,
+        "host": socket.gethostname(),
+        "roots": [os.path.abspath(root) for root in roots],
+        "created": time.time(),
+        "files": len(store),
+    }
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps(header) + "\n")
+        for row in store.rows():
+            hash_val, duration, size = store.key(row)
+            record = {"path": remap_path(store.path(row), path_map), "hash": hash_val, "duration": duration, "size": size,
+                      "mtime_ns": int(store.mtimes[row])}
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, path)
+
+
+def read_shard(path):
+    # Returns (header, records); records lazily yields one dict per file
+    f = gzip.open(path, "rt", encoding="utf-8")
+    try:
+        header = json.loads(f.readline() or "null")
+    except (OSError, ValueError) as e:
+        f.close()
+        raise ValueError(f"{path}: not a signature shard ({e})") from e
+    if not isinstance(header, dict) or header.get("format") != SHARD_FORMAT:
+        f.close()
+        raise ValueError(f"{path}: not a signature shard")
+    if header.get("version", 0) > SHARD_VERSION:
+        f.close()
+        raise ValueError(f"{path}: shard version {header['version']} is newer than this version supports "
+                         f"({SHARD_VERSION})")
+
+    def records():
+        with f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    return header, records()
+
+
+def remap_path(path, path_map):
+    # path_map: (prefix, replacement) pairs, longest prefix first. A prefix only
+    # matches whole path components, so /volume1/videos leaves
+    # /volume1/videos2 alone. Shards can come from other machines, so both /
+    # and the local separator count as a boundary.
+    separators = "/" + os.sep
+    for prefix, replacement in path_map:
+        if path == prefix:
+            return replacement
+        base = prefix.rstrip(separators)
+        if path.startswith(base) and path[len(base):len(base) + 1] in tuple(separators):
+            return replacement.rstrip(separators) + path[len(base):]
+    return path
+
+
+def merge_shards(shard_paths, log=None, match_mode="exact", hamming_threshold=DEFAULT_HAMMING_THRESHOLD,
+                 duration_tolerance=DEFAULT_DURATION_TOLERANCE, path_map=None, spill_dir=None):
+    # Combines shards into duplicate groups in the same format find_duplicates
+    # returns. path_map rewrites each node's local paths, e.g.
+    # [("/volume1/videos", "/mnt/nas1/videos")].
+    log = log or (lambda msg: None)
+    if not shard_paths:
+        raise ValueError("No signature shards given")
+    path_map = sorted(path_map or [], key=lambda pair: -len(pair[0]))
+    shards = [read_shard(path) for path in shard_paths]
+    kinds = {header.get("signature") for header, _ in shards}
+    if len(kinds) > 1:
+        raise ValueError(f"Shards use different signatures ({', '.join(sorted(map(str, kinds)))}); "
+                         f"scan every node with the same number of frames")
+    frames = max(1, shards[0][0].get("frames", 1))
+
+    with SignatureStore(hash_words=frames, spill_dir=spill_dir) as store:
+        for path, (header, records) in zip(shard_paths, shards):
+            log(f"📦 {os.path.basename(path)}: {header.get('files', '?')} files from {header.get('host', '?')}")
+            for record in records:
+                store.append(len(store), remap_path(record["path"], path_map), record["hash"],
+                             record["duration"], record["size"], record.get("mtime_ns", 0))
+
+        group_start = time.perf_counter()
+        if match_mode == "near":
+            log(f"🔗 Near matching: Hamming ≤ {hamming_threshold} per frame, duration ± {duration_tolerance}s")
+            grouped = group_near_duplicates(list(store.entries()), hamming_threshold * frames, duration_tolerance)
+        else:
+            grouped = store.exact_groups()
+
+    # Overlapping shards list the same file twice, and nodes that scanned
+    # different trees can each hold one name of the same file (a symlink and
+    # its target, or hardlinks). Neither is a duplicate, and deleting one name
+    # in favour of a symlink to it would destroy the data. Each scan folds its
+    # own links; across shards that is done here, for the files this machine
+    # can reach.
+    dupes = {}
+    overlapping = linked = 0
+    for key, files in grouped.items():
+        unique = list(dict.fromkeys(files))
+        overlapping += len(files) - len(unique)
+        unique, dropped = fold_linked_names(unique)
+        linked += dropped
+        if len(unique) > 1:
+            dupes[key] = keep_linked_first(unique)
+    if overlapping:
+        log(f"⚠️ Ignored {overlapping} files listed in more than one shard.")
+    if linked:
+        log(f"🔗 Ignored {linked} files that are another name (hardlink or symlink) of a file in the same group.")
+    log(f"📁 Found {len(dupes)} duplicate groups across {len(shard_paths)} shards "
+        f"in {time.perf_counter() - group_start:.1f}s.")
+    return dupes
+
+
+def scan_folder(folder, log, progress_queue=None, kill_flag=None, cache=None, workers=1, prune=True,
+                match_mode="exact", hamming_threshold=DEFAULT_HAMMING_THRESHOLD,
+                duration_tolerance=DEFAULT_DURATION_TOLERANCE, frames=1, extensions=VIDEO_EXTENSIONS,
+                stats=None, spill_dir=None, shard_path=None, path_map=None, file_timeout=DEFAULT_FILE_TIMEOUT,
+                isolate=True, retry_quarantined=False):
+    # `folder` may be a single root or a list of roots. Signatures are
+    # collected in a SignatureStore; pass spill_dir to memory-map it to disk
+    # and shard_path to also save them as a signature shard (with paths
+    # rewritten through path_map).
+    log("🔍 Scanning for duplicates...")
+    roots = [folder] if isinstance(folder, (str, os.PathLike)) else list(folder)
+    roots, covered = distinct_roots(roots)
+    for root in covered:
+        log(f"📂 Skipping {root}: already covered by another root.")
+    links = LinkTracker(roots, extensions)
+
+    # Discovery runs in its own thread and feeds hashing through a bounded
+    # queue, so decoding starts with the first candidate instead of after the
+    # whole tree has been walked.
+    discovery_queue = queue.Queue(maxsize=DISCOVERY_QUEUE_SIZE)
+    stop_discovery = threading.Event()
+    flags = (stop_discovery, kill_flag) if kill_flag else (stop_discovery,)
+    threading.Thread(target=discover_video_files, args=(roots, extensions, discovery_queue, *flags),
+                     kwargs={"stats": stats, "links": links}, daemon=True).start()
+
+    # Re-encodes and trims change the byte size, so near matching has to
+    # decode everything. So does writing a shard: a size that is unique here
+    # may well exist on another node.
+    prune = prune and match_mode == "exact" and not shard_path
+    stream = CandidateStream(discovery_queue, prune=prune, kill_flag=kill_flag, stats=stats)
+    processed = 0
+
+    def report(full_path, timings, worker_rss=None):
+        nonlocal processed
+        processed += 1
+        if stats is not None:
+            stats.add_file(full_path, timings, worker_rss)
+        total = stream.total
+        if total is None:
+            log(f"Indexed file {processed} ({stream.discovered} discovered): {os.path.basename(full_path)}")
+        else:
+            log(f"Indexed file {processed}/{total}: {os.path.basename(full_path)}")
+
+        if progress_queue:
+            progress_queue.put((processed, total, full_path, stream.discovered))
+
+    skipped = 0
+
+    def skip(full_path, reason):
+        nonlocal skipped
+        skipped += 1
+        if stats is not None:
+            stats.add_skipped(full_path, reason)
+        log(f"⚠️ Skipped {full_path}: {reason}")
+
+    with SignatureStore(hash_words=max(1, frames), spill_dir=spill_dir) as store:
+        try:
+            if not isolate:
+                log("⚙️ Hashing in-process without a per-file deadline.")
+            elif workers > 1:
+                log(f"⚙️ Hashing with {workers} worker processes.")
+            hash_candidates(stream, store, cache, workers, frames, report, kill_flag, skip, file_timeout, isolate,
+                            retry_quarantined)
+        finally:
+            stop_discovery.set()
+        if kill_flag and kill_flag.is_set():
+            log("❌ Scan killed by user.")
+            return {}
+
+        if skipped:
+            log(f"🚫 Quarantined {skipped} unreadable files; they are skipped until they change.")
+        hardlinks = links.hardlink_groups()
+        if hardlinks or links.aliases:
+            log(f"🔗 {sum(len(paths) - 1 for _, paths in hardlinks) + links.aliases} files were further names of "
+                f"files already found (hardlinks or symlinks) and were not decoded again.")
+        for size, paths in hardlinks:
+            if stats is not None:
+                stats.add_hardlinks(size, paths)
+            log(f"🔗 Already hardlinked ({format_bytes(size)}): {' = '.join(paths)}")
+        if stream.prune:
+            log(f"📏 Size tier: {stream.size_shared}/{stream.discovered} files share a size.")
+            log(f"🧩 Partial digest tier: {stream.emitted}/{stream.size_shared} files left to decode.")
+
+        if cache is not None:
+            log(cache.stats())
+            evicted = cache.evict(roots)
+            if evicted:
+                log(f"🗄️ Evicted {evicted} stale cache entries.")
+
+        if shard_path:
+            write_shard(shard_path, store, roots, max(1, frames), path_map)
+            log(f"📦 Signature shard with {len(store)} files written to {shard_path}")
+
+        # Group in discovery order so the result never depends on completion order
+        group_start = time.perf_counter()
+        if match_mode == "near":
+            log(f"🔗 Near matching: Hamming ≤ {hamming_threshold} per frame, duration ± {duration_tolerance}s")
+            # The threshold is per sampled frame; signatures concatenate all frames
+            dupes = group_near_duplicates(list(store.entries()), hamming_threshold * max(1, frames),
+                                          duration_tolerance)
+        else:
+            dupes = store.exact_groups()
+        dupes = {key: keep_linked_first(files) for key, files in dupes.items()}
+        reclaimable = sum(reclaimable_bytes(files) for files in dupes.values())
+        if stats is not None:
+            stats.add("group", time.perf_counter() - group_start)
+            stats.finish()
+        log(f"📁 Found {len(dupes)} duplicate groups, {format_bytes(reclaimable)} reclaimable.")
+        return dupes
+
+
+def find_duplicates(roots, log=None, extensions=VIDEO_EXTENSIONS, workers=1, match_mode="exact",
+                    hamming_threshold=DEFAULT_HAMMING_THRESHOLD, duration_tolerance=DEFAULT_DURATION_TOLERANCE,
+                    frames=1, prune=True, use_cache=True, cache_path=None, progress_queue=None, kill_flag=None,
+                    stats=None, profile_path=None, spill_dir=None, shard_path=None, path_map=None,
+                    file_timeout=DEFAULT_FILE_TIMEOUT, isolate=True, retry_quarantined=False):
+    # Library entry point: scan_folder plus signature cache management. Pass a
+    # ScanStats to collect stage timings and the skip list, and profile_path
+    # to run the scan under cProfile (this process only, so decoding is only
+    # profiled with isolate=False).
+    log = log or (lambda msg: None)
+    cache = None
+    if use_cache:
+        try:
+            cache = SignatureCache(cache_path)
+        except (OSError, sqlite3.Error) as e:
+            log(f"⚠️ Signature cache unavailable, hashing everything: {e}")
+    profiler = None
+    if profile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        return scan_folder(roots, log, progress_queue=progress_queue, kill_flag=kill_flag, cache=cache,
+                           workers=workers, prune=prune, match_mode=match_mode,
+                           hamming_threshold=hamming_threshold, duration_tolerance=duration_tolerance,
+                           frames=frames, extensions=extensions, stats=stats, spill_dir=spill_dir,
+                           shard_path=shard_path, path_map=path_map, file_timeout=file_timeout,
+                           isolate=isolate, retry_quarantined=retry_quarantined)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            log(f"📊 Profile written to {profile_path}")
+        if cache is not None:
+            cache.close()
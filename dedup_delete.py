@@ -0,0 +1,448 @@
+# Background deletion engine for the video de-duplicator. Marked duplicates
+# are removed, or replaced by a hardlink or copy-on-write reflink to the copy
+# being kept, on a small thread pool that works through one directory per
+# batch. Every operation is recorded in an append-only journal, so a run that
+# is killed or crashes can be resumed where it stopped.
+import os
+import sys
+import json
+import stat
+import time
+import errno
+import shutil
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from dedup_core import default_cache_dir, format_bytes
+
+DELETE_ACTIONS = ("delete", "hardlink", "reflink")
+DELETE_WORKERS = 4
+JOURNAL_FORMAT = "dedup-delete-journal"
+JOURNAL_VERSION = 1
+JOURNAL_SUFFIX = ".journal"
+DONE_SUFFIX = ".done"
+TMP_SUFFIX = ".dedup-tmp"
+PROGRESS_LOG_SECONDS = 2.0
+RECYCLE_BIN_FORMAT = "dedup-recycle-bin"
+RECYCLE_BIN_VERSION = 1
+# Rewrite the recycle bin journal on load once it holds this many records
+# more than its live state needs
+RECYCLE_BIN_COMPACT_SLACK = 1000
+FICLONE = 0x40049409  # ioctl(2) on Linux btrfs/XFS/bcachefs
+
+
+def default_journal_dir():
+    return os.path.join(default_cache_dir(), "journals")
+
+
+def default_recycle_bin_path():
+    return os.path.join(default_cache_dir(), "recycle-bin.jsonl")
+
+
+def reflink(src, dst):
+    # Copy-on-write clone of src at dst; OSError where the file system or
+    # platform cannot do it
+    if sys.platform.startswith("linux"):
+        import fcntl
+        try:
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            _remove_quietly(dst)
+            raise
+    elif sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), dst)
+    else:
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported on this platform", dst)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _freed(st):
+    # A symlink, or a file with other hardlinks, frees nothing when removed
+    if stat.S_ISLNK(st.st_mode) or st.st_nlink > 1:
+        return 0
+    return st.st_size
+
+
+def apply_operation(op):
+    # Returns (result, bytes reclaimed). Refuses to touch a file whose kept
+    # copy is gone, is a symlink to it, or that changed size since it was
+    # marked. `path` itself is never followed: a symlink is removed or
+    # replaced, not its target.
+    path, keep, action = op["path"], op["keep"], op["action"]
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return "already gone", 0
+    if keep is None:
+        if action != "delete":
+            raise OSError(errno.EINVAL, "no kept copy recorded to link to", path)
+    else:
+        try:
+            keep_st = os.stat(keep)
+        except FileNotFoundError:
+            raise OSError(errno.ENOENT, f"kept copy {keep} no longer exists", path) from None
+        if os.path.realpath(keep) == os.path.realpath(path):
+            if not stat.S_ISLNK(st.st_mode):
+                # The kept copy only reaches its data through this file
+                raise OSError(errno.EINVAL, f"kept copy {keep} is a symlink to this file", path)
+            if action != "delete":
+                return "already linked", 0
+        elif (st.st_dev, st.st_ino) == (keep_st.st_dev, keep_st.st_ino):
+            if action != "delete":
+                return "already linked", 0
+            # Deleting one name of a hardlinked pair frees nothing but is safe
+    if op.get("size") is not None and st.st_size != op["size"]:
+        raise OSError(errno.EAGAIN, f"changed since it was marked ({op['size']} -> {st.st_size} bytes)", path)
+
+    if action == "delete":
+        os.remove(path)
+        return "deleted", _freed(st)
+
+    # Build the replacement next to the duplicate, then swap it in atomically
+    tmp = path + TMP_SUFFIX
+    _remove_quietly(tmp)
+    try:
+        if action == "hardlink":
+            os.link(keep, tmp)
+        else:
+            reflink(keep, tmp)
+            shutil.copystat(path, tmp)
+        os.replace(tmp, path)
+    except OSError:
+        _remove_quietly(tmp)
+        raise
+    return ("hardlinked" if action == "hardlink" else "reflinked"), _freed(st)
+
+
+class DeletionJournal:
+    # Append-only JSON Lines: a header, one "plan" record per operation, then a
+    # "done" or "failed" record as each one finishes. Flushed and fsynced after
+    # every directory batch; renamed to *.done once nothing is left.
+    def __init__(self, path):
+        self.path = path
+        self.header = None
+        self.ops = {}        # path -> plan record, in plan order
+        self.finished = {}   # path -> done/failed record
+        self.lock = threading.Lock()
+        self.file = None
+
+    @classmethod
+    def create(cls, items, action, directory=None):
+        # items: (path to remove, path being kept) pairs
+        if action not in DELETE_ACTIONS:
+            raise ValueError(f"Unknown action {action!r}")
+        directory = directory or default_journal_dir()
+        os.makedirs(directory, exist_ok=True)
+        name = time.strftime("delete-%Y%m%d-%H%M%S") + f"-{os.getpid()}{JOURNAL_SUFFIX}"
+        journal = cls(os.path.join(directory, name))
+        journal.file = open(journal.path, "a", encoding="utf-8")
+        journal.header = {"format": JOURNAL_FORMAT, "version": JOURNAL_VERSION, "action": action,
+                          "created": time.time()}
+        journal._write(journal.header)
+        for path, keep in items:
+            try:
+                size = os.lstat(path).st_size  # what apply_operation will compare against
+            except OSError:
+                size = None
+            op = {"op": "plan", "path": path, "keep": keep, "action": action, "size": size}
+            journal.ops[path] = op
+            journal._write(op)
+        journal.sync()
+        return journal
+
+    @classmethod
+    def load(cls, path):
+        journal = cls(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        for line in data.decode("utf-8", "replace").splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crash
+            if record.get("format") == JOURNAL_FORMAT:
+                journal.header = record
+            elif record.get("op") == "plan":
+                journal.ops[record["path"]] = record
+            elif record.get("op") in ("done", "failed"):
+                journal.finished[record["path"]] = record
+        if journal.header is None:
+            raise ValueError(f"{path}: not a deletion journal")
+        if journal.header.get("version", 0) > JOURNAL_VERSION:
+            raise ValueError(f"{path}: journal version {journal.header['version']} is newer than supported")
+        journal.file = open(path, "a", encoding="utf-8")
+        if data and not data.endswith(b"\n"):
+            journal.file.write("\n")
+        return journal
+
+    @property
+    def action(self):
+        return self.header["action"]
+
+    def pending(self):
+        return [op for path, op in self.ops.items() if path not in self.finished]
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def record(self, path, op, **fields):
+        record = {"op": op, "path": path, **fields}
+        with self.lock:
+            self.finished[path] = record
+            self._write(record)
+
+    def sync(self):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is None:
+            return
+        self.sync()
+        self.file.close()
+        self.file = None
+        if not self.pending():
+            os.replace(self.path, self.path + DONE_SUFFIX)
+            self.path += DONE_SUFFIX
+
+
+def unfinished_journals(directory=None):
+    directory = directory or default_journal_dir()
+    try:
+        names = sorted(n for n in os.listdir(directory) if n.endswith(JOURNAL_SUFFIX))
+    except OSError:
+        return []
+    journals = []
+    for name in names:
+        try:
+            journal = DeletionJournal.load(os.path.join(directory, name))
+        except (OSError, ValueError):
+            continue
+        if journal.pending():
+            journals.append(journal)
+        else:
+            journal.close()
+    return journals
+
+
+def run_deletion(journal, log=None, progress=None, workers=DELETE_WORKERS, kill_flag=None):
+    # Executes the journal's pending operations, one directory per batch, on
+    # `workers` threads. progress(done, total, path) is called after every
+    # file. Returns a summary dict; the journal is left open for the caller.
+    log = log or (lambda msg: None)
+    progress = progress or (lambda done, total, path: None)
+    batches = defaultdict(list)
+    for op in journal.pending():
+        batches[os.path.dirname(op["path"])].append(op)
+    total = sum(len(ops) for ops in batches.values())
+    counts = {"done": 0, "failed": 0, "freed": 0}
+    lock = threading.Lock()
+    started = time.monotonic()
+    last_report = [started]
+    log(f"🧹 {journal.action.capitalize()}: {total} files in {len(batches)} folders")
+
+    def run_batch(ops):
+        for op in ops:
+            if kill_flag and kill_flag.is_set():
+                break
+            path = op["path"]
+            try:
+                result, freed = apply_operation(op)
+                journal.record(path, "done", result=result, freed=freed)
+                log(f"{result.capitalize()}: {path}")
+            except OSError as e:
+                result, freed = None, 0
+                journal.record(path, "failed", error=str(e))
+                log(f"Failed to {op['action']} {path}: {e}")
+            with lock:
+                counts["done" if result else "failed"] += 1
+                counts["freed"] += freed
+                finished = counts["done"] + counts["failed"]
+                now = time.monotonic()
+                if now - last_report[0] >= PROGRESS_LOG_SECONDS:
+                    last_report[0] = now
+                    elapsed = now - started
+                    log(f"🧹 {finished}/{total} files, {format_bytes(counts['freed'])} reclaimed "
+                        f"({finished / elapsed:.1f} files/s, {format_bytes(counts['freed'] / elapsed)}/s)")
+            progress(finished, total, path)
+        journal.sync()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for future in [executor.submit(run_batch, ops) for ops in batches.values()]:
+            future.result()
+
+    elapsed = time.monotonic() - started
+    summary = {"total": total, "done": counts["done"], "failed": counts["failed"],
+               "remaining": len(journal.pending()), "freed_bytes": counts["freed"], "seconds": elapsed}
+    log(f"♻️ {counts['done']} files processed, {counts['failed']} failed, {format_bytes(counts['freed'])} "
+        f"reclaimed in {elapsed:.1f}s.")
+    return summary
+
+
+class RecycleBin:
+    # Files marked for deletion, each with the copy kept from its group.
+    # Membership and removal are dict operations, and every mark is one undo
+    # step holding the files it added. The state is an append-only journal of
+    # mark/undo/redo/clear records that is replayed on open, so marks survive
+    # a restart until the bin is emptied. path=None keeps it in memory only.
+    def __init__(self, path=None):
+        self.path = path
+        self.marked = {}     # path -> kept copy, in marking order
+        self.undo_stack = []  # lists of (path, keep) added by one mark
+        self.redo_stack = []
+        self.file = None
+        if path is None:
+            return
+        records, torn = 0, False
+        if os.path.exists(path):
+            records, torn = self._replay(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        live = len(self.undo_stack) + 2 * len(self.redo_stack)
+        if not records or torn or records > live + RECYCLE_BIN_COMPACT_SLACK:
+            self._rewrite()
+        else:
+            self.file = open(path, "a", encoding="utf-8")
+
+    def _replay(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        records = 0
+        for line in data.decode("utf-8", "replace").splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crash
+            records += 1
+            op = record.get("op")
+            if record.get("format") == RECYCLE_BIN_FORMAT:
+                if record.get("version", 0) > RECYCLE_BIN_VERSION:
+                    raise ValueError(f"{path}: recycle bin version {record['version']} is newer than supported")
+            elif op == "mark":
+                self._mark([tuple(item) for item in record["items"]])
+            elif op == "undo":
+                self._undo()
+            elif op == "redo":
+                self._redo()
+            elif op == "clear":
+                self._clear()
+        # Never append after a torn line; rewrite the file instead
+        return records, bool(data) and not data.endswith(b"\n")
+
+    def _rewrite(self):
+        # Same state in the fewest records: the undo stack as marks, then the
+        # redo stack marked newest-first and undone again
+        if self.file is not None:
+            self.file.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            lines = [{"format": RECYCLE_BIN_FORMAT, "version": RECYCLE_BIN_VERSION}]
+            lines += [{"op": "mark", "items": items} for items in self.undo_stack]
+            lines += [{"op": "mark", "items": items} for items in reversed(self.redo_stack)]
+            lines += [{"op": "undo"}] * len(self.redo_stack)
+            f.writelines(json.dumps(line) + "\n" for line in lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def _write(self, record):
+        if self.file is not None:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+
+    def __len__(self):
+        return len(self.marked)
+
+    def __contains__(self, path):
+        return path in self.marked
+
+    def __iter__(self):
+        return iter(self.marked)
+
+    def items(self):
+        return list(self.marked.items())
+
+    def keep_for(self, path):
+        return self.marked.get(path)
+
+    @property
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    @property
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def _mark(self, items):
+        added = [(path, keep) for path, keep in items if path not in self.marked]
+        if added:
+            self.marked.update(added)
+            self.undo_stack.append(added)
+            self.redo_stack.clear()
+        return added
+
+    def _undo(self):
+        if not self.undo_stack:
+            return []
+        items = self.undo_stack.pop()
+        for path, _ in items:
+            self.marked.pop(path, None)
+        self.redo_stack.append(items)
+        return items
+
+    def _redo(self):
+        if not self.redo_stack:
+            return []
+        items = self.redo_stack.pop()
+        self.marked.update(items)
+        self.undo_stack.append(items)
+        return items
+
+    def _clear(self):
+        self.marked.clear()
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    def mark(self, items):
+        # items: (path to remove, path being kept) pairs marked as one undo
+        # step. Returns the pairs that were not already marked.
+        added = self._mark(items)
+        if added:
+            self._write({"op": "mark", "items": added})
+        return added
+
+    def undo(self):
+        items = self._undo()
+        if items:
+            self._write({"op": "undo"})
+        return items
+
+    def redo(self):
+        items = self._redo()
+        if items:
+            self._write({"op": "redo"})
+        return items
+
+    def clear(self):
+        self._clear()
+        if self.file is not None:
+            self._rewrite()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,141 @@
+# Preview loading for manual review: a thumbnail and stream metadata per file,
+# decoded ahead of time in supervised worker processes into a bounded LRU
+# cache so the review window never waits on a decoder when it moves to the
+# next group.
+import os
+import base64
+import threading
+from collections import OrderedDict, namedtuple
+
+from dedup_core import HashWorkerPool, format_bytes, probe_video
+
+THUMB_WIDTH = 240
+THUMB_HEIGHT = 135
+# Where in the video the thumbnail is taken; the very first frame is often
+# black or a shared intro
+THUMB_POSITION = 0.1
+PREFETCH_GROUPS = 5
+PREFETCH_WORKERS = 2
+PREVIEW_TIMEOUT = 30.0
+PREVIEW_CACHE_SIZE = 64
+
+FilePreview = namedtuple("FilePreview", "path size duration width height codec bitrate thumbnail error",
+                         defaults=(None,) * 8)
+
+
+def encode_thumbnail(frame, cv2, size=(THUMB_WIDTH, THUMB_HEIGHT)):
+    # Scaled to fit size and returned as base64 PNG, which tk.PhotoImage
+    # accepts directly, so no Tk or PIL work happens off the main thread
+    height, width = frame.shape[:2]
+    scale = min(size[0] / width, size[1] / height, 1.0)
+    if scale < 1.0:
+        frame = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    success, png = cv2.imencode(".png", frame)
+    return base64.b64encode(png.tobytes()).decode("ascii") if success else None
+
+
+def load_preview(path):
+    try:
+        size = os.path.getsize(path)
+    except OSError as e:
+        return FilePreview(path, error=e.strerror or str(e))
+    probe = probe_video(path, position=THUMB_POSITION)
+    if probe is None:
+        return FilePreview(path, size, error="could not be opened")
+    try:
+        import cv2
+        thumbnail = encode_thumbnail(probe.frame, cv2) if probe.frame is not None else None
+    except Exception as e:
+        return FilePreview(path, size, error=f"could not be decoded: {e}")
+    bitrate = size * 8 / probe.duration if probe.duration else None
+    return FilePreview(path, size, probe.duration, probe.width, probe.height, probe.codec, bitrate, thumbnail)
+
+
+def describe_preview(preview):
+    if preview.error:
+        return f"⚠️ {preview.error}"
+    parts = []
+    if preview.width and preview.height:
+        parts.append(f"{preview.width}×{preview.height}")
+    if preview.codec:
+        parts.append(preview.codec)
+    if preview.bitrate:
+        parts.append(f"{preview.bitrate / 1e6:.1f} Mb/s")
+    details = []
+    if preview.duration:
+        details.append(f"{preview.duration:.1f}s")
+    details.append(format_bytes(preview.size))
+    return " · ".join(parts) + "\n" + " · ".join(details)
+
+
+class Prefetcher:
+    # Keeps previews for the files most likely to be shown next. schedule()
+    # replaces the wanted list (in priority order) whenever the review moves
+    # on, so stale work is dropped rather than queued. Previews are decoded in
+    # supervised worker processes with a deadline, like the scan: groups
+    # merged from shards were decoded on other machines, and the scan never
+    # seeks to THUMB_POSITION, so a file here can still hang or crash a
+    # decoder. One thread hands out work and collects the results.
+    def __init__(self, cache_size=PREVIEW_CACHE_SIZE, workers=PREFETCH_WORKERS, timeout=PREVIEW_TIMEOUT,
+                 loader=load_preview):
+        self.cache_size = cache_size
+        self.pool = HashWorkerPool(workers, timeout=timeout, job=loader)
+        self.cache = OrderedDict()
+        self.wanted = []
+        self.in_flight = set()
+        self.closed = False
+        self.cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def schedule(self, paths):
+        # Never want more than half the cache, so prefetching cannot evict
+        # what it just loaded for the group on screen
+        with self.cond:
+            self.wanted = list(dict.fromkeys(paths))[:max(1, self.cache_size // 2)]
+            self.cond.notify_all()
+
+    def get(self, path):
+        with self.cond:
+            preview = self.cache.get(path)
+            if preview is not None:
+                self.cache.move_to_end(path)
+            return preview
+
+    def _next_path(self):
+        for path in self.wanted:
+            if path not in self.cache and path not in self.in_flight:
+                return path
+        return None
+
+    def _run(self):
+        try:
+            while True:
+                with self.cond:
+                    while not self.closed and not self.pool.busy and self._next_path() is None:
+                        self.cond.wait()
+                    if self.closed:
+                        return
+                    while self.pool.has_capacity():
+                        path = self._next_path()
+                        if path is None:
+                            break
+                        self.in_flight.add(path)
+                        self.pool.submit(path, path)
+                finished = self.pool.poll(0.2)
+                with self.cond:
+                    for path, preview, failure in finished:
+                        self.in_flight.discard(path)
+                        if failure is not None:
+                            preview = FilePreview(path, error=f"preview {failure}")
+                        self.cache[path] = preview
+                        self.cache.move_to_end(path)
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+        finally:
+            self.pool.close()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
@@ -0,0 +1,509 @@
+# Watch mode for the video de-duplicator. Keeps a live index of every video
+# under a set of roots and reports a duplicate group as soon as a newly
+# arrived file matches an existing one. Changes come from inotify on Linux and
+# from periodic polling everywhere else. Signatures persist in the
+# SignatureCache, which is keyed by device and inode, so a restart only
+# decodes files that changed while the watcher was down and a rename never
+# decodes anything.
+import os
+import sys
+import time
+import stat
+import errno
+import select
+import struct
+import sqlite3
+import threading
+import ctypes
+import ctypes.util
+from collections import defaultdict, namedtuple
+
+from dedup_core import (
+    SignatureCache,
+    SignatureStore,
+    HashWorkerPool,
+    format_bytes,
+    hash_candidates,
+    iter_video_entries,
+    iter_video_files,
+    signature_kind,
+    VIDEO_EXTENSIONS,
+    DEFAULT_FILE_TIMEOUT,
+)
+
+WATCH_SETTLE_SECONDS = 0.5   # quiet period that closes an inotify batch
+WATCH_MAX_BATCH_SECONDS = 5.0
+WATCH_POLL_SECONDS = 10.0
+
+# signature is None until another file of the same size shows up, False when
+# the file could not be decoded, else (hash, duration)
+IndexedFile = namedtuple("IndexedFile", "st signature")
+
+
+def _same_version(a, b):
+    return (a.st_dev, a.st_ino, a.st_size, a.st_mtime_ns) == (b.st_dev, b.st_ino, b.st_size, b.st_mtime_ns)
+
+
+def _inode_at(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+class DuplicateIndex:
+    # Live exact-match index. Like a full scan, a file is only decoded once
+    # another file of the same size exists, and further names of a file that
+    # is already indexed (hardlinks, and symlinks to it) are set aside rather
+    # than reported as its duplicates; hardlinks go to on_hardlink(size,
+    # paths) instead. One worker pool serves the whole lifetime of the index,
+    # so an arriving file does not pay for a fresh process re-importing the
+    # decoders; close() shuts it down.
+    def __init__(self, cache=None, frames=1, log=None, on_group=None, file_timeout=DEFAULT_FILE_TIMEOUT,
+                 workers=1, on_hardlink=None):
+        self.cache = cache
+        self.frames = frames
+        self.pool = HashWorkerPool(workers, frames, file_timeout)
+        self.log = log or (lambda msg: None)
+        self.on_group = on_group or (lambda key, files, new_path: None)
+        self.on_hardlink = on_hardlink or (lambda size, paths: None)
+        self.files = {}                   # path -> IndexedFile, in arrival order
+        self.inodes = {}                  # (dev, ino) -> indexed path
+        self.links = defaultdict(dict)    # (dev, ino) -> {further name: is_symlink}
+        self.link_of = {}                 # further name -> (dev, ino)
+        self.by_size = defaultdict(set)   # size -> paths
+        self.groups = defaultdict(list)   # (hash, duration, size) -> paths
+
+    def __len__(self):
+        return len(self.files)
+
+    def duplicate_groups(self):
+        return {key: list(files) for key, files in self.groups.items() if len(files) > 1}
+
+    def hardlink_groups(self):
+        # (size, [indexed name, other hardlinks...]) per file with several hardlinked names
+        groups = []
+        for inode, names in self.links.items():
+            hardlinks = [name for name, is_link in names.items() if not is_link]
+            if hardlinks:
+                path = self.inodes[inode]
+                groups.append((self.files[path].st.st_size, [path] + hardlinks))
+        return groups
+
+    def close(self):
+        self.pool.close()
+
+    def load(self, roots, extensions=VIDEO_EXTENSIONS, kill_flag=None):
+        # Initial sync: index every file, then hash the ones sharing a size
+        for root in roots:
+            for path, st, is_link in iter_video_entries(root, extensions):
+                if not self._fold(path, st, is_link, report=False):
+                    self._insert(path, st)
+        hardlinks = self.hardlink_groups()
+        if self.link_of:
+            self.log(f"🔗 {len(self.link_of)} files are further names of files already indexed (hardlinks or "
+                     f"symlinks) and are not decoded again.")
+        for size, paths in hardlinks:
+            self._report_hardlinks(size, paths)
+        shared = [path for path, entry in self.files.items() if len(self.by_size[entry.st.st_size]) > 1]
+        self._hash(shared, kill_flag)
+        if kill_flag and kill_flag.is_set():
+            return
+        if self.cache is not None:
+            self.cache.commit()
+        for key, files in self.duplicate_groups().items():
+            self.on_group(key, files, None)
+
+    def apply(self, paths, dirs=(), extensions=VIDEO_EXTENSIONS):
+        # Reconciles the index with the file system for `paths` and everything
+        # under `dirs`. Files that exist are handled first, so a rename seen as
+        # "old path gone, new path appeared" moves the entry instead of
+        # retiring and re-adding it.
+        paths = set(paths)
+        for folder in dirs:
+            prefix = os.path.join(folder, "")
+            paths.update(path for path in list(self.files) + list(self.link_of) if path.startswith(prefix))
+            paths.update(path for path, _ in iter_video_files(folder, extensions))
+        present, missing = [], []
+        for path in sorted(paths):
+            try:
+                st = os.stat(path)
+            except OSError:
+                missing.append(path)
+                continue
+            if stat.S_ISREG(st.st_mode):
+                present.append((path, st))
+            else:
+                missing.append(path)
+        for path, st in present:
+            self._update(path, st, os.path.islink(path))
+        for path in missing:
+            if path in self.link_of:
+                self._unlink(path)
+                self.log(f"🗑️ Removed from index: {path}")
+            elif path in self.files:
+                self._retire(path)
+                self.log(f"🗑️ Removed from index: {path}")
+        if self.cache is not None:
+            self.cache.commit()
+
+    def _key(self, path):
+        entry = self.files[path]
+        return entry.signature + (entry.st.st_size,)
+
+    def _insert(self, path, st):
+        self.files[path] = IndexedFile(st, None)
+        self.inodes[(st.st_dev, st.st_ino)] = path
+        self.by_size[st.st_size].add(path)
+
+    def _remove(self, path):
+        # Drops the entry along with the further names of its file, which are
+        # returned so the caller can index them again
+        if self.files[path].signature:
+            key = self._key(path)
+            self.groups[key].remove(path)
+            if not self.groups[key]:
+                del self.groups[key]
+        entry = self.files.pop(path)
+        inode = (entry.st.st_dev, entry.st.st_ino)
+        if self.inodes.get(inode) == path:
+            del self.inodes[inode]
+        peers = self.by_size[entry.st.st_size]
+        peers.discard(path)
+        if not peers:
+            del self.by_size[entry.st.st_size]
+        names = self.links.pop(inode, {})
+        for name in names:
+            del self.link_of[name]
+        return names
+
+    def _retire(self, path):
+        # The indexed name is gone; an unchanged further name of the same file
+        # takes over its entry, signature and place in its group
+        entry = self.files[path]
+        inode = (entry.st.st_dev, entry.st.st_ino)
+        for name in list(self.links.get(inode, ())):
+            try:
+                st = os.stat(name)
+            except OSError:
+                continue
+            if _same_version(entry.st, st):
+                self._unlink(name)
+                self._move(path, name, st)
+                return
+        self._reindex(self._remove(path))
+
+    def _reindex(self, names):
+        for name, is_link in names.items():
+            try:
+                st = os.stat(name)
+            except OSError:
+                continue
+            self._update(name, st, is_link)
+
+    def _set_signature(self, path, signature):
+        self.files[path] = self.files[path]._replace(signature=signature)
+        if not signature:
+            return None
+        key = self._key(path)
+        self.groups[key].append(path)
+        return key
+
+    def _skip(self, path, reason):
+        self.log(f"⚠️ Skipped {path}: {reason}")
+
+    def _report_hardlinks(self, size, paths):
+        self.log(f"🔗 Already hardlinked ({format_bytes(size)}): {' = '.join(paths)}")
+        self.on_hardlink(size, paths)
+
+    def _fold(self, path, st, is_link, report=True):
+        # True if `path` is another name of a file that is already indexed under
+        # a name that still exists. A real name replaces an indexed symlink.
+        inode = (st.st_dev, st.st_ino)
+        indexed = self.inodes.get(inode)
+        if not st.st_ino or indexed is None or indexed == path or _inode_at(indexed) != inode:
+            return False
+        if not is_link and os.path.islink(indexed):
+            self._move(indexed, path, st)
+            indexed, path, is_link = path, indexed, True
+        self.links[inode][path] = is_link
+        self.link_of[path] = inode
+        if not report:
+            return True
+        if is_link:
+            self.log(f"🔗 {path} is a symlink to {indexed}; not indexed again.")
+        else:
+            hardlinks = [name for name, link in self.links[inode].items() if not link]
+            self._report_hardlinks(st.st_size, [indexed] + hardlinks)
+        return True
+
+    def _unlink(self, path):
+        inode = self.link_of.pop(path)
+        names = self.links[inode]
+        del names[path]
+        if not names:
+            del self.links[inode]
+
+    def _hash(self, paths, kill_flag=None):
+        # Decoded in supervised workers, so a bad file cannot hang or crash the
+        # watcher. Returns the group key of each path that could be decoded.
+        with SignatureStore(hash_words=max(1, self.frames), capacity=max(1, len(paths))) as store:
+            candidates = [(idx, path, self.files[path].st) for idx, path in enumerate(paths)]
+            hash_candidates(candidates, store, self.cache, frames=self.frames, kill_flag=kill_flag, skip=self._skip,
+                            pool=self.pool)
+            hashed = {path: (hash_val, duration) for path, hash_val, duration, _ in store.entries()}
+        if kill_flag and kill_flag.is_set():
+            return {}
+        return {path: self._set_signature(path, hashed.get(path, False)) for path in paths}
+
+    def _update(self, path, st, is_link=False):
+        inode = (st.st_dev, st.st_ino)
+        if path in self.link_of:
+            if self.link_of[path] == inode:
+                return  # still a further name of the same file
+            self._unlink(path)
+        names = {}
+        entry = self.files.get(path)
+        if entry is not None:
+            if _same_version(entry.st, st):
+                return
+            names = self._remove(path)  # rewritten in place
+        if not self._fold(path, st, is_link):
+            old_path = self.inodes.get(inode)
+            if (old_path is not None and old_path != path and _inode_at(old_path) != inode
+                    and _same_version(self.files[old_path].st, st)):
+                self._rename(old_path, path, st)
+            else:
+                self._add(path, st)
+        self._reindex(names)
+
+    def _move(self, old_path, path, st):
+        # Same inode and contents under another name: keep the signature and
+        # the file's place in its group
+        entry = self.files.pop(old_path)
+        self.files[path] = entry._replace(st=st)
+        self.inodes[(st.st_dev, st.st_ino)] = path
+        peers = self.by_size[st.st_size]
+        peers.discard(old_path)
+        peers.add(path)
+        if entry.signature:
+            files = self.groups[self._key(path)]
+            files[files.index(old_path)] = path
+            if self.cache is not None:
+                # A cache hit records the new path, so eviction keeps the entry
+                self.cache.get(path, st, signature_kind(self.frames))
+
+    def _rename(self, old_path, path, st):
+        self._move(old_path, path, st)
+        self.log(f"🔀 Renamed {old_path} → {path}")
+
+    def _add(self, path, st):
+        self._insert(path, st)
+        self.log(f"Indexed file {len(self.files)}: {os.path.basename(path)}")
+        peers = self.by_size[st.st_size]
+        if len(peers) < 2:
+            return  # unique size, nothing to compare against yet
+        # The new file and any peers not decoded yet go to the pool as one batch
+        pending = [peer for peer in peers - {path} if self.files[peer].signature is None]
+        key = self._hash(pending + [path]).get(path)
+        if key is not None and len(self.groups[key]) > 1:
+            self.on_group(key, list(self.groups[key]), path)
+
+
+class PollingSource:
+    # Portable fallback that re-walks the roots every `interval` seconds. A
+    # change is only reported once it has held still for a whole interval, so
+    # files that are still being copied are not decoded half-written and both
+    # halves of a rename land in the same batch.
+    name = "polling"
+
+    def __init__(self, roots, extensions=VIDEO_EXTENSIONS, interval=WATCH_POLL_SECONDS):
+        self.roots = list(roots)
+        self.extensions = extensions
+        self.interval = interval
+        self.previous = self._snapshot()
+
+    def _snapshot(self):
+        snapshot = {}
+        for root in self.roots:
+            for path, st in iter_video_files(root, self.extensions):
+                snapshot[path] = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def batches(self, stop_flag):
+        pending = set()
+        while not stop_flag.wait(self.interval):
+            current = self._snapshot()
+            changed = {path for path in self.previous.keys() | current.keys()
+                       if self.previous.get(path) != current.get(path)}
+            ready = pending - changed
+            pending = changed
+            self.previous = current
+            if ready:
+                yield ready, ()
+
+    def close(self):
+        pass
+
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+class InotifySource:
+    # One watch per directory. File events are collected until the tree has
+    # been quiet for WATCH_SETTLE_SECONDS, then handed over as one batch.
+    # Files are picked up on close-after-write or move-in, never on create, so
+    # a copy in progress is not decoded.
+    name = "inotify"
+
+    def __init__(self, roots, extensions=VIDEO_EXTENSIONS):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.roots = list(roots)
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.watches = {}  # wd -> directory
+        try:
+            for root in self.roots:
+                self._watch_tree(root, strict=True)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch_tree(self, folder, strict=False):
+        for dirpath, _, _ in os.walk(folder):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), INOTIFY_MASK)
+            if wd >= 0:
+                self.watches[wd] = dirpath
+                continue
+            err = ctypes.get_errno()
+            if strict and err == errno.ENOSPC:
+                raise OSError(err, "inotify watch limit reached (fs.inotify.max_user_watches)")
+
+    def _unwatch_tree(self, folder):
+        prefix = os.path.join(folder, "")
+        for wd, path in list(self.watches.items()):
+            if path == folder or path.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def _read_events(self):
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                yield wd, mask, name
+
+    def batches(self, stop_flag):
+        paths, dirs = set(), set()
+        first = last = None
+        while not stop_flag.is_set():
+            readable, _, _ = select.select([self.fd], [], [], 0.2)
+            now = time.monotonic()
+            if readable:
+                for wd, mask, name in self._read_events():
+                    if mask & IN_Q_OVERFLOW:
+                        dirs.update(self.roots)  # events were dropped; reconcile everything
+                        continue
+                    if mask & (IN_IGNORED | IN_DELETE_SELF):
+                        self.watches.pop(wd, None)
+                        continue
+                    folder = self.watches.get(wd)
+                    if folder is None or not name:
+                        continue
+                    path = os.path.join(folder, name)
+                    if mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            self._watch_tree(path)
+                            dirs.add(path)
+                        elif mask & (IN_MOVED_FROM | IN_DELETE):
+                            self._unwatch_tree(path)
+                            dirs.add(path)
+                    elif name.lower().endswith(self.extensions) and mask & (
+                            IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+                        paths.add(path)
+                if paths or dirs:
+                    first = first or now
+                    last = now
+            if first is not None and (now - last >= WATCH_SETTLE_SECONDS
+                                      or now - first >= WATCH_MAX_BATCH_SECONDS):
+                yield paths, dirs
+                paths, dirs = set(), set()
+                first = last = None
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def open_change_source(roots, extensions=VIDEO_EXTENSIONS, poll=False, poll_interval=WATCH_POLL_SECONDS, log=None):
+    log = log or (lambda msg: None)
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifySource(roots, extensions)
+        except (OSError, AttributeError) as e:
+            log(f"⚠️ inotify unavailable, falling back to polling: {e}")
+    return PollingSource(roots, extensions, poll_interval)
+
+
+def watch(roots, log=None, on_group=None, extensions=VIDEO_EXTENSIONS, workers=1, frames=1, use_cache=True,
+          cache_path=None, poll=False, poll_interval=WATCH_POLL_SECONDS, stop_flag=None,
+          file_timeout=DEFAULT_FILE_TIMEOUT, on_hardlink=None):
+    # Runs until stop_flag is set. on_group(key, files, new_path) is called for
+    # each group found by the initial sync (new_path is None) and again every
+    # time a newly arrived file joins a group. Exact matching only. Names that
+    # are hardlinks of an indexed file go to on_hardlink(size, paths) instead.
+    log = log or (lambda msg: None)
+    stop_flag = stop_flag or threading.Event()
+    roots = [roots] if isinstance(roots, (str, os.PathLike)) else list(roots)
+    cache = None
+    if use_cache:
+        try:
+            cache = SignatureCache(cache_path)
+        except (OSError, sqlite3.Error) as e:
+            log(f"⚠️ Signature cache unavailable, hashing everything: {e}")
+    # Start watching before the initial walk so nothing that changes during it is missed
+    source = open_change_source(roots, extensions, poll, poll_interval, log)
+    index = DuplicateIndex(cache, frames, log, on_group, file_timeout, workers, on_hardlink)
+    try:
+        log("🔍 Indexing watched folders...")
+        index.load(roots, extensions, stop_flag)
+        log(f"📁 Indexed {len(index)} files, {len(index.duplicate_groups())} duplicate groups.")
+        log(f"👀 Watching {len(roots)} folder(s) using {source.name}.")
+        for paths, dirs in source.batches(stop_flag):
+            index.apply(paths, dirs, extensions)
+    finally:
+        index.close()
+        source.close()
+        if cache is not None:
+            cache.close()
+    return index
@@ -0,0 +1,148 @@
+import os
+import errno
+
+import pytest
+
+from dedup_delete import (
+    DONE_SUFFIX,
+    TMP_SUFFIX,
+    DeletionJournal,
+    apply_operation,
+    run_deletion,
+    unfinished_journals,
+)
+
+
+def make_file(path, data=b"video"):
+    path.write_bytes(data)
+    return str(path)
+
+
+def make_pair(tmp_path, data=b"video"):
+    keep = make_file(tmp_path / "keep.mp4", data)
+    dupe = make_file(tmp_path / "dupe.mp4", data)
+    return dupe, keep
+
+
+def op(path, keep, action="delete", size=None):
+    return {"op": "plan", "path": path, "keep": keep, "action": action,
+            "size": os.lstat(path).st_size if size is None else size}
+
+
+def test_delete_removes_duplicate(tmp_path):
+    dupe, keep = make_pair(tmp_path)
+    assert apply_operation(op(dupe, keep)) == ("deleted", 5)
+    assert not os.path.exists(dupe)
+    assert os.path.exists(keep)
+
+
+def test_delete_of_missing_file_is_not_an_error(tmp_path):
+    dupe, keep = make_pair(tmp_path)
+    planned = op(dupe, keep)
+    os.remove(dupe)
+    assert apply_operation(planned) == ("already gone", 0)
+
+
+def test_changed_size_is_refused(tmp_path):
+    dupe, keep = make_pair(tmp_path)
+    planned = op(dupe, keep)
+    with open(dupe, "ab") as f:
+        f.write(b" re-encoded")
+    with pytest.raises(OSError) as excinfo:
+        apply_operation(planned)
+    assert excinfo.value.errno == errno.EAGAIN
+    assert os.path.exists(dupe)
+
+
+@pytest.mark.parametrize("action", ["delete", "hardlink"])
+def test_missing_kept_copy_is_refused(tmp_path, action):
+    dupe, keep = make_pair(tmp_path)
+    os.remove(keep)
+    with pytest.raises(OSError) as excinfo:
+        apply_operation(op(dupe, keep, action))
+    assert excinfo.value.errno == errno.ENOENT
+    assert os.path.exists(dupe)
+
+
+def test_hardlink_swaps_duplicate_for_link_to_kept_copy(tmp_path):
+    dupe, keep = make_pair(tmp_path)
+    planned = op(dupe, keep, "hardlink")
+    assert apply_operation(planned) == ("hardlinked", 5)
+    assert os.path.samefile(dupe, keep)
+    assert os.stat(keep).st_nlink == 2
+    assert not os.path.exists(dupe + TMP_SUFFIX)
+    # Running the same operation again is a no-op
+    assert apply_operation(planned) == ("already linked", 0)
+
+
+def test_deleting_one_name_of_a_hardlink_frees_nothing(tmp_path):
+    keep = make_file(tmp_path / "keep.mp4")
+    dupe = str(tmp_path / "dupe.mp4")
+    os.link(keep, dupe)
+    assert apply_operation(op(dupe, keep)) == ("deleted", 0)
+    assert os.path.exists(keep)
+
+
+@pytest.mark.parametrize("action", ["delete", "hardlink"])
+def test_kept_symlink_to_the_duplicate_is_refused(tmp_path, action):
+    # Merged shards can group a symlink with its target; deleting the target
+    # would leave the kept symlink dangling
+    dupe = make_file(tmp_path / "only_copy.mp4")
+    keep = str(tmp_path / "alias.mp4")
+    os.symlink(dupe, keep)
+    with pytest.raises(OSError) as excinfo:
+        apply_operation(op(dupe, keep, action))
+    assert excinfo.value.errno == errno.EINVAL
+    assert os.path.exists(dupe)
+    assert os.path.exists(keep)
+
+
+def test_deleting_a_symlink_removes_only_the_link(tmp_path):
+    keep = make_file(tmp_path / "keep.mp4")
+    dupe = str(tmp_path / "alias.mp4")
+    os.symlink(keep, dupe)
+    assert apply_operation(op(dupe, keep, "hardlink")) == ("already linked", 0)
+    assert apply_operation(op(dupe, keep)) == ("deleted", 0)
+    assert not os.path.lexists(dupe)
+    assert os.path.exists(keep)
+
+
+def test_journal_resumes_after_interruption(tmp_path):
+    library = tmp_path / "library"
+    library.mkdir()
+    keep = make_file(library / "keep.mp4")
+    dupes = [make_file(library / f"dupe{i}.mp4") for i in range(3)]
+    journal_dir = str(tmp_path / "journals")
+
+    journal = DeletionJournal.create([(path, keep) for path in dupes], "delete", journal_dir)
+    # The first operation completes, then the process dies mid-write
+    first = journal.pending()[0]
+    journal.record(first["path"], "done", result=apply_operation(first)[0], freed=5)
+    journal.sync()
+    journal.file.write('{"op": "done", "pa')
+    journal.file.close()
+
+    resumed = unfinished_journals(journal_dir)
+    assert len(resumed) == 1
+    assert [p["path"] for p in resumed[0].pending()] == dupes[1:]
+
+    summary = run_deletion(resumed[0])
+    assert (summary["done"], summary["failed"], summary["remaining"]) == (2, 0, 0)
+    resumed[0].close()
+    assert resumed[0].path.endswith(DONE_SUFFIX)
+    assert unfinished_journals(journal_dir) == []
+    assert not any(os.path.exists(path) for path in dupes)
+    assert os.path.exists(keep)
+
+
+def test_failed_operation_is_recorded_and_not_retried(tmp_path):
+    dupe, keep = make_pair(tmp_path)
+    journal = DeletionJournal.create([(dupe, keep)], "delete", str(tmp_path / "journals"))
+    os.remove(keep)
+    summary = run_deletion(journal)
+    assert (summary["done"], summary["failed"], summary["remaining"]) == (0, 1, 0)
+    journal.close()
+    assert os.path.exists(dupe)
+    reloaded = DeletionJournal.load(journal.path)
+    assert reloaded.finished[dupe]["op"] == "failed"
+    reloaded.close()
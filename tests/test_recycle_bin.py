@@ -0,0 +1,78 @@
+import json
+
+import dedup_delete
+from dedup_delete import RecycleBin
+
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_marks_undo_and_redo_survive_a_restart(tmp_path):
+    path = str(tmp_path / "bin" / "recycle-bin.jsonl")
+    recycle = RecycleBin(path)
+    recycle.mark([("a.mp4", "keep1.mp4"), ("b.mp4", "keep1.mp4")])
+    recycle.mark([("c.mp4", "keep2.mp4")])
+    recycle.mark([("d.mp4", "keep3.mp4")])
+    recycle.undo()
+    recycle.undo()
+    recycle.redo()
+    recycle.close()
+
+    reopened = RecycleBin(path)
+    assert reopened.items() == [("a.mp4", "keep1.mp4"), ("b.mp4", "keep1.mp4"), ("c.mp4", "keep2.mp4")]
+    assert reopened.can_redo
+    assert reopened.redo() == [("d.mp4", "keep3.mp4")]
+    assert reopened.undo() == [("d.mp4", "keep3.mp4")]
+    assert reopened.undo() == [("c.mp4", "keep2.mp4")]
+    reopened.close()
+
+
+def test_clear_empties_the_journal(tmp_path):
+    path = str(tmp_path / "recycle-bin.jsonl")
+    recycle = RecycleBin(path)
+    recycle.mark([("a.mp4", "keep.mp4")])
+    recycle.clear()
+    recycle.close()
+    assert len(read_records(path)) == 1  # just the header
+    assert len(RecycleBin(path)) == 0
+
+
+def test_journal_is_compacted_on_open(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup_delete, "RECYCLE_BIN_COMPACT_SLACK", 10)
+    path = str(tmp_path / "recycle-bin.jsonl")
+    recycle = RecycleBin(path)
+    recycle.mark([("a.mp4", "keep.mp4")])
+    for _ in range(20):
+        recycle.mark([("b.mp4", "keep.mp4")])
+        recycle.undo()
+        recycle.redo()
+        recycle.undo()
+    recycle.close()
+    assert len(read_records(path)) > 60
+
+    reopened = RecycleBin(path)
+    assert reopened.items() == [("a.mp4", "keep.mp4")]
+    assert reopened.redo() == [("b.mp4", "keep.mp4")]
+    reopened.undo()
+    reopened.close()
+    # header, two marks and one undo for the redo stack, plus the redo and undo above
+    assert len(read_records(path)) == 6
+
+
+def test_torn_last_line_is_dropped_and_the_journal_repaired(tmp_path):
+    path = str(tmp_path / "recycle-bin.jsonl")
+    recycle = RecycleBin(path)
+    recycle.mark([("a.mp4", "keep.mp4")])
+    recycle.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "mark", "items": [["b.mp4", "ke')  # crash mid-write
+
+    reopened = RecycleBin(path)
+    assert reopened.items() == [("a.mp4", "keep.mp4")]
+    reopened.mark([("c.mp4", "keep.mp4")])
+    reopened.close()
+    records = read_records(path)  # every line parses again
+    assert [r.get("op") for r in records] == [None, "mark", "mark"]
+    assert RecycleBin(path).items() == [("a.mp4", "keep.mp4"), ("c.mp4", "keep.mp4")]